@@ -0,0 +1,59 @@
+"""
+Compare the plan based converters against the generated ones from
+`howard.compile`.
+
+    python -m benchmarks.bench_compile
+"""
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import List, Optional
+import timeit
+
+import howard
+
+
+class Suit(Enum):
+    heart = 'h'
+    spade = 's'
+    diamond = 'd'
+    club = 'c'
+
+
+def _models():
+    @dataclass
+    class Card:
+        rank: int
+        suit: Suit
+
+    @dataclass
+    class Hand:
+        hand_id: int = 0
+        owner: Optional[str] = None
+        cards: List[Card] = field(default_factory=list)
+        scores: List[int] = field(default_factory=list)
+
+    return Hand
+
+
+PAYLOAD = {
+    'hand_id': 2,
+    'owner': 'howard',
+    'cards': [{'rank': r, 'suit': s} for r in range(1, 14) for s in 'hsdc'][:10],
+    'scores': list(range(20)),
+}
+
+
+def main(number=20000):
+    plain = _models()
+    compiled = howard.compile(_models())
+
+    for name, t in (('plan', plain), ('compiled', compiled)):
+        obj = howard.from_dict(PAYLOAD, t)
+        decode = timeit.timeit(lambda: howard.from_dict(PAYLOAD, t), number=number)
+        encode = timeit.timeit(lambda: howard.to_dict(obj), number=number)
+        print(f'{name:>10}: from_dict {number / decode:>10.0f} ops/s   '
+              f'to_dict {number / encode:>10.0f} ops/s')
+
+
+if __name__ == '__main__':
+    main()
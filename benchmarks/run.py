@@ -0,0 +1,275 @@
+"""
+Throughput benchmarks for howard conversions.
+
+    python -m benchmarks.run                     # run all scenarios
+    python -m benchmarks.run -k union -k hand    # only matching scenarios
+    python -m benchmarks.run --json out.json     # also save the results
+    python -m benchmarks.run --compare HEAD~3    # compare against another commit
+
+For every scenario this reports `from_dict`, `to_dict` and `dumps` records per
+second, `from_dict` records per second for trusted input (validate=False), and the
+memory allocated per decoded record (peak traced by tracemalloc).
+`--compare` checks the given git revision out into a temporary worktree and runs
+the same scenarios against the howard found there.
+"""
+from dataclasses import dataclass, field, make_dataclass
+from datetime import date, datetime
+from enum import Enum
+from typing import Dict, List, Literal, Optional, TypedDict, Union
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import howard
+
+
+class Suit(Enum):
+    heart = 'h'
+    spade = 's'
+    diamond = 'd'
+    club = 'c'
+
+
+@dataclass
+class Card:
+    rank: int
+    suit: Suit
+
+
+@dataclass
+class Hand:
+    hand_id: int = 0
+    cards: List[Card] = field(default_factory=list)
+
+
+@dataclass
+class Game:
+    hand: Hand
+    scores: List[float]
+
+
+Wide = make_dataclass('Wide', [
+    (f'f{i}', (int, str, float, bool)[i % 4]) for i in range(48)
+])
+
+
+def _deep(levels):
+    t = make_dataclass('Level0', [('value', int)])
+    for i in range(1, levels):
+        t = make_dataclass(f'Level{i}', [('value', int), ('child', t)])
+    return t
+
+
+Deep = _deep(20)
+
+
+@dataclass
+class Series:
+    values: List[float]
+
+
+@dataclass
+class Index:
+    entries: Dict[str, int]
+
+
+@dataclass
+class Click:
+    kind: Literal['click']
+    x: int
+    y: int
+
+
+@dataclass
+class Scroll:
+    kind: Literal['scroll']
+    x: int
+    delta: int
+
+
+@dataclass
+class Resize:
+    width: int
+    height: int
+
+
+@dataclass
+class Events:
+    tagged: List[Union[Click, Scroll]]
+    untagged: List[Union[Resize, Card, str]]
+
+
+Point = TypedDict('Point', {'x': float, 'y': float, 'label': str})
+
+
+@dataclass
+class Shape:
+    points: List[Point]
+
+
+@dataclass
+class Record:
+    created: datetime
+    updated: Optional[datetime]
+    day: date
+
+
+def _wide_payload():
+    values = (1, 'a', 1.5, True)
+    return {f'f{i}': values[i % 4] for i in range(48)}
+
+
+def _deep_payload(levels):
+    d = {'value': 0}
+    for i in range(1, levels):
+        d = {'value': i, 'child': d}
+    return d
+
+
+SCENARIOS = {
+    'hand': (Hand, {'hand_id': 2, 'cards': [{'rank': r, 'suit': 'hsdc'[r % 4]} for r in range(1, 14)]}),
+    'card': (Card, {'rank': 2, 'suit': 'c'}),
+    'game': (Game, {
+        'hand': {'hand_id': 1, 'cards': [{'rank': r % 13 + 1, 'suit': 'hsdc'[r % 4]} for r in range(50)]},
+        'scores': [i * 0.25 for i in range(200)],
+    }),
+    'wide_flat': (Wide, _wide_payload()),
+    'deep_nesting': (Deep, _deep_payload(20)),
+    'large_list': (Series, {'values': [i * 0.5 for i in range(10000)]}),
+    'large_dict': (Index, {'entries': {f'key{i}': i for i in range(10000)}}),
+    'unions': (Events, {
+        'tagged': [{'kind': 'click', 'x': 1, 'y': 2}, {'kind': 'scroll', 'x': 1, 'delta': 3}] * 10,
+        'untagged': [{'width': 1, 'height': 2}, {'rank': 1, 'suit': 'h'}, 'text'] * 10,
+    }),
+    'typed_dict': (Shape, {'points': [{'x': 1.0, 'y': 2.0, 'label': 'p'}] * 20}),
+    'datetimes': (Record, {'created': '2020-01-15T13:15:30+00:00', 'updated': None, 'day': '2020-01-15'}),
+}
+
+
+def _ops_per_second(fn):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=3, number=number))
+    return number / best
+
+
+def _alloc_per_record(t, payload, records=200):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        results = [howard.from_dict(payload, t) for _ in range(records)]
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del results
+    return (peak - start) / records
+
+
+def run(selected=()):
+    results = {}
+    for name, (t, payload) in SCENARIOS.items():
+        if selected and not any(s in name for s in selected):
+            continue
+        try:
+            obj = howard.from_dict(payload, t)
+        except TypeError:  # a howard that doesnt support the types used yet
+            results[name] = dict.fromkeys(['from_dict', 'trusted', 'to_dict', 'dumps', 'alloc'])
+            continue
+        try:
+            howard.from_dict(payload, t, validate=False)
+        except TypeError:  # a howard from before validate=False
+            trusted = None
+        else:
+            trusted = _ops_per_second(lambda: howard.from_dict(payload, t, validate=False))
+        try:
+            howard.to_dict(obj)
+        except TypeError:
+            to_dict = None
+        else:
+            to_dict = _ops_per_second(lambda: howard.to_dict(obj))
+        try:
+            howard.dumps(obj)
+        except (AttributeError, TypeError):  # a howard from before dumps
+            dumps = None
+        else:
+            dumps = _ops_per_second(lambda: howard.dumps(obj))
+        results[name] = {
+            'from_dict': _ops_per_second(lambda: howard.from_dict(payload, t)),
+            'trusted': trusted,
+            'to_dict': to_dict,
+            'dumps': dumps,
+            'alloc': _alloc_per_record(t, payload),
+        }
+    return results
+
+
+COLUMNS = [('from_dict', 'from_dict/s'), ('trusted', 'trusted/s'), ('to_dict', 'to_dict/s'), ('dumps', 'dumps/s')]
+
+
+def report(results, baseline=None):
+    header = f'{"scenario":<14}' + ''.join(f'{title:>14}' for _, title in COLUMNS) + f'{"alloc/record":>14}'
+    if baseline:
+        header += ''.join(f'{key:>11}' for key, _ in COLUMNS) + f'{"alloc":>11}'
+    print(header)
+    for name, r in results.items():
+        line = f'{name:<14}' + ''.join(_number(r.get(key), 14) for key, _ in COLUMNS)
+        line += _number(r['alloc'], 13) + ('B' if r['alloc'] is not None else ' ')
+        if baseline and name in baseline:
+            b = baseline[name]
+            for key in [key for key, _ in COLUMNS] + ['alloc']:
+                ratio = r[key] / b[key] if r.get(key) and b.get(key) else None
+                line += _number(ratio, 10, '.2f') + ('x' if ratio else ' ')
+        print(line)
+
+
+def _number(value, width, spec='.0f'):
+    return f'{"-":>{width}}' if value is None else f'{value:>{width}{spec}}'
+
+
+def _run_at(rev, selected):
+    """ Run the scenarios against the howard from another git revision """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp:
+        worktree = os.path.join(tmp, 'howard')
+        subprocess.run(['git', 'worktree', 'add', '--detach', worktree, rev],
+                       cwd=root, check=True, capture_output=True)
+        try:
+            out = os.path.join(tmp, 'results.json')
+            args = [sys.executable, os.path.abspath(__file__), '--json', out, '--quiet']
+            for s in selected:
+                args += ['-k', s]
+            env = dict(os.environ, PYTHONPATH=worktree)
+            subprocess.run(args, cwd=tmp, env=env, check=True)
+            with open(out) as f:
+                return json.load(f)
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree],
+                           cwd=root, check=True, capture_output=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark howard conversions')
+    parser.add_argument('-k', dest='selected', action='append', default=[],
+                        help='only run scenarios containing this string')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', metavar='REV', help='git revision to compare against')
+    parser.add_argument('--quiet', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    baseline = _run_at(args.compare, args.selected) if args.compare else None
+    results = run(args.selected)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if not args.quiet:
+        report(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,132 @@
+import array
+import builtins
+import codecs
+import contextlib
+import collections
 import dataclasses
-from datetime import datetime
-import dateutil.parser
+import functools
+import itertools
+from datetime import date, datetime, time, timedelta, timezone
+import io
+import json
+import marshal
+import os
+import re
+import sys
+import threading
+import time as _time
+from types import CodeType
 import typing
+import weakref
 from typing import TypeVar, Union, Type
-from enum import EnumMeta
+from enum import Enum, EnumMeta
+
+if typing.TYPE_CHECKING:
+    import asyncio
+    from concurrent import futures
 
 
 T = TypeVar('T')
 
 
 class HowardError(TypeError):
-    """ Used when howard cant correctly parse because the types dont match """
+    """
+    Used when howard cant correctly parse because the types dont match
+
+    Errors about a value carry the `value` itself, the `expected` type and the
+    `path` to it in the data being converted, like `('cards', 3, 'rank')`.
+    The message is only formatted when the error is shown, so failures that
+    are caught and dropped, like union members that didnt match, stay cheap.
+    When every error was collected, they are in `errors`.
+
+    >>> @dataclasses.dataclass
+    ... class Hand:
+    ...     cards: typing.List[int]
+    >>> try:
+    ...     from_dict({'cards': [1, 2, '3']}, Hand)
+    ... except HowardError as e:
+    ...     print(e.path, repr(e.value), e.expected)
+    ...     print(e)
+    ('cards', 2) '3' <class 'int'>
+    cards[2]: Object "3" not of expected type <class 'int'>
+    """
+
+    def __init__(self, message: str, value: typing.Any = None, expected: typing.Any = None,
+                 errors: typing.Sequence['HowardError'] = ()):
+        super().__init__(message)
+        self.value = value
+        self.expected = expected
+        self.path = ()
+        self.errors = list(errors)
+        # the input the path starts at, set by compiled decoders, see _locate
+        self._source = None
+        # whether it was raised walking a value too deep for the plans, see _walk_when_deep
+        self._walked = False
+
+    @property
+    def location(self) -> str:
+        """ The path formatted like python code, e.g. `cards[3].rank` """
+        parts = []
+        for segment in self.path:
+            if isinstance(segment, str) and segment.isidentifier():
+                parts.append(f'.{segment}')
+            else:
+                parts.append(f'[{segment!r}]')
+        return ''.join(parts).lstrip('.')
+
+    def __str__(self):
+        if self.errors:
+            return '\n'.join([self.args[0]] + [f'  {e}' for e in self.errors])
+        message = self.args[0]
+        if self.value is not None or self.expected is not None:
+            message = message.format(value=self.value, expected=self.expected)
+        return f'{self.location}: {message}' if self.path else message
+
+    def _at(self, segment):
+        """ Mark the error as coming from segment, one level further out """
+        self.path = (segment,) + self.path
+        self._source = None
+        for error in self.errors:
+            error._at(segment)
+        return self
+
+    def _flatten(self):
+        return self.errors or [self]
 
 
-def from_dict(d: dict, t: Type[T], ignore_extras: bool = True) -> T:
+# Set to True to parse datetimes that aren't ISO 8601 with `dateutil`, which
+# has to be installed separately (`pip install howard[dateutil]`)
+dateutil_fallback = False
+
+# Directory where the bytecode of converters generated by `compile` is kept,
+# so new processes can skip compiling them again. Not kept when None.
+cache_dir = os.environ.get('HOWARD_CACHE_DIR')
+
+
+def from_dict(d: dict, t: Type[T], ignore_extras: bool = True, lazy: bool = False,
+              copy: bool = True, validate: bool = True, all_errors: bool = False,
+              track_changes: bool = False) -> T:
     """
     Initialise an instance of the dataclass t using the values in the dict d
 
+    With lazy=True, fields holding dataclasses, lists or dicts are only decoded
+    when they are first accessed, and any errors in them are raised then.
+    A single field can be made lazy with `metadata={'howard': {'lazy': True}}`.
+
+    With copy=False, lists and dicts in d that already hold values of the
+    right types are used as they are instead of being copied, so they are
+    shared between d and the result.
+
+    With validate=False, d is trusted to have the right types, e.g. because it
+    was produced by `to_dict`. Type checks and extra key checks are skipped,
+    but custom decoders, enums and datetimes are still converted.
+
+    With all_errors=True, a HowardError for d lists every problem found in
+    its `errors`, instead of stopping at the first one.
+
+    With track_changes=True, a `snapshot` of the result is taken, so that
+    `to_delta` can tell which fields changed afterwards.
+
     Example:
 
     >>> @dataclasses.dataclass
@@ -33,13 +143,20 @@ def from_dict(d: dict, t: Type[T], ignore_extras: bool = True) -> T:
     if not dataclasses.is_dataclass(t):
         raise HowardError("Second argument must be a dataclass")
 
-    return _convert_to(d, t, ignore_extras)
+    options = _Options(ignore_extras or not validate, lazy, copy, validate, _profiler is not None, all_errors)
+    result = _get_decoder(t, options)(d)
+    if track_changes:
+        snapshot(result)
+    return result
 
 
-def to_dict(obj: T, public_only=False) -> dict:
+def to_dict(obj: T, public_only=False, copy: bool = True) -> dict:
     """
     Marshall a dataclass instance into a dict
 
+    With copy=False, lists and dicts that only hold values that need no
+    converting are put in the result as they are instead of being copied.
+
     Example:
 
     >>> @dataclasses.dataclass
@@ -54,143 +171,2717 @@ def to_dict(obj: T, public_only=False) -> dict:
     if not dataclasses.is_dataclass(obj):
         raise HowardError('Argument must be a dataclass')
 
-    return _convert_from(obj, public=public_only)
+    return _convert_from(obj, _EncodeOptions(public_only, copy, _profiler is not None))
 
 
-def _convert_to(obj, t, ignore_extras=True):
-    kwargs = {}
-    if t == typing.Any:
-        return obj
-    if dataclasses.is_dataclass(t):
-        for f in dataclasses.fields(t):
-            if f.name in obj:
-                # get value
-                value = obj[f.name]
-                decoder = f.metadata.get('howard', {}).get('decoder')
-                if decoder:
-                    kwargs[f.name] = decoder(value)
-                else:
-                    kwargs[f.name] = _convert_to(value, f.type, ignore_extras=ignore_extras)
+def apply_patch(obj: T, patch: dict, ignore_extras: bool = True, in_place: bool = False) -> T:
+    """
+    Update the dataclass instance obj with the values in the partial dict patch
+
+    Only the keys in patch are decoded, the same way `from_dict` would, every
+    other field keeps its value as it is. By default a new instance is made
+    with `dataclasses.replace`. With in_place=True, obj itself is updated,
+    which doesnt work for frozen dataclasses.
+
+    Example:
+
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...     age: int
+    ...
+    >>> apply_patch(Person('Howard', 24), {'age': 25})
+    Person(name='Howard', age=25)
+    """
+    if not dataclasses.is_dataclass(obj) or isinstance(obj, type):
+        raise HowardError('First argument must be a dataclass instance')
+    if not isinstance(patch, dict):
+        raise HowardError('Second argument must be of type dict')
+    if in_place and obj.__dataclass_params__.frozen:
+        raise HowardError('Instances of frozen dataclasses cant be updated in place')
+
+    t = obj.__class__
+    options = _Options(ignore_extras)
+    try:
+        decoders = _patchers[t, options]
+    except KeyError:
+        decoders = _patchers[t, options] = _build_patcher(t, options)
+    changes = {}
+    for name, value in patch.items():
+        decoder = decoders.get(name)
+        if decoder is None:
+            if not ignore_extras:
+                raise HowardError('Found unexpected keys {value} when converting to {expected}',
+                                  patch.keys() - decoders.keys(), t)
+            continue
+        try:
+            changes[name] = decoder(value)
+        except HowardError as e:
+            raise e._at(name)
+
+    if not in_place:
+        return dataclasses.replace(obj, **changes)
+    for name, value in changes.items():
+        setattr(obj, name, value)
+    return obj
+
+
+# Field decoders used by `apply_patch`, keyed by (type, options)
+_patchers = {}
+
+
+def _build_patcher(t, options):
+    types = _type_hints(t, strict=True)
+    return {
+        f.name: _field_decoder(f, types[f.name], options) or _get_decoder(types[f.name], options)
+        for f in dataclasses.fields(t)
+        if f.init
+    }
+
+
+def snapshot(obj: T) -> T:
+    """
+    Remember the current state of the dataclass instance obj, and of the
+    dataclasses, lists and dicts it holds, for `to_delta`. Returns obj.
+    """
+    if not dataclasses.is_dataclass(obj) or isinstance(obj, type):
+        raise HowardError('Argument must be a dataclass instance')
+
+    instances = [obj]
+    while instances:
+        instance = instances.pop()
+        state = tuple((value, _contents(value, instances)) for value in _field_values(instance))
+        key = id(instance)
+        try:
+            ref = weakref.ref(instance, lambda _, key=key: _snapshots.pop(key, None))
+        except TypeError:
+            continue  # slotted without weak references, never counts as unchanged
+        _snapshots[key] = (ref, state)
+    return obj
+
+
+# The state of instances passed to `snapshot`, keyed by their id, as (weak reference
+# to the instance, state). Kept outside of the instances, so it doesnt show up in
+# vars(), copies or pickles of them, and works the same for frozen dataclasses.
+_snapshots = {}
+
+
+def to_delta(obj: T, public_only=False) -> dict:
+    """
+    Marshall only the fields of the dataclass instance obj that changed since
+    its last `snapshot` into a dict
+
+    Fields holding another dataclass instance that changed inside give the
+    delta of that instance. Lists and dicts where anything changed are
+    marshalled in full. Without a snapshot, all of obj is marshalled.
+
+    Example:
+
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...     age: int
+    ...
+    >>> person = from_dict({'name': 'Howard', 'age': 24}, Person, track_changes=True)
+    >>> person.age += 1
+    >>> to_delta(person)
+    {'age': 25}
+    """
+    if not dataclasses.is_dataclass(obj) or isinstance(obj, type):
+        raise HowardError('Argument must be a dataclass instance')
+
+    options = _EncodeOptions(public_only)
+    delta = _delta(obj, options)
+    return _convert_from(obj, options) if delta is None else delta
+
+
+def _contents(value, instances):
+    """ What is inside the list or dict value, to tell if it was changed in place later """
+    if isinstance(value, list):
+        return tuple((item, _contents(item, instances)) for item in value)
+    if isinstance(value, dict):
+        return tuple((key, item, _contents(item, instances)) for key, item in value.items())
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        instances.append(value)
+    return None
+
+
+def _field_values(instance):
+    """ The values of the fields of instance, without decoding lazy fields that are still pending """
+    d = getattr(instance, '__dict__', {})
+    return [d[f.name] if f.name in d else getattr(instance, f.name) for f in dataclasses.fields(instance)]
+
+
+def _delta(obj, options):
+    """ The changed fields of obj, or None if it has no snapshot """
+    # the deltas of the instances obj holds are worked out first, innermost first,
+    # with a stack instead of recursing once per level of nesting
+    deltas = {}
+    seen = set()
+    stack = [(obj, False)]
+    while stack:
+        instance, children_done = stack.pop()
+        ref, state = _snapshots.get(id(instance), (None, None))
+        if ref is None or ref() is not instance:
+            continue
+        if children_done:
+            deltas[id(instance)] = _changes(instance, state, options, deltas)
+            continue
+        if id(instance) in seen:
+            continue
+        seen.add(id(instance))
+        stack.append((instance, True))
+        for value, (old, contents) in zip(_field_values(instance), state):
+            if value is old:
+                stack += [(kept, False) for kept in _kept_instances(value, contents)]
+    return deltas.get(id(obj))
+
+
+def _kept_instances(value, contents):
+    """ The dataclass instances in value, that were already there when contents was taken """
+    found = []
+    stack = [(value, contents)]
+    while stack:
+        value, contents = stack.pop()
+        if contents is None:
+            if dataclasses.is_dataclass(value) and not isinstance(value, type):
+                found.append(value)
+        elif isinstance(value, dict):
+            stack += [(item, item_contents) for item, (_, old_item, item_contents) in zip(value.values(), contents)
+                      if item is old_item]
+        else:
+            stack += [(item, item_contents) for item, (old_item, item_contents) in zip(value, contents)
+                      if item is old_item]
+    return found
+
+
+def _changes(obj, state, options, deltas):
+    """ The changed fields of obj, given the deltas of the instances it holds """
+    delta = {}
+    for f, value, (old, contents) in zip(dataclasses.fields(obj), _field_values(obj), state):
+        if f.name.startswith('_') and options.public:
+            continue
+        if f.metadata.get('internal', False):
+            continue
+        if value is old and value.__class__ is _Pending:
+            continue  # a lazy field that wasnt even decoded yet
+        encoder = f.metadata.get('howard', {}).get('encoder')
+        # custom encoders get the whole value, not only what changed in it
+        if value is old and contents is None and dataclasses.is_dataclass(value) and not encoder:
+            inner = deltas.get(id(value))
+            if inner == {}:
+                continue
+            if inner is not None:
+                delta[f.name] = inner
+                continue
+        elif _unchanged(value, old, contents, deltas):
+            continue
+        value = getattr(obj, f.name)
+        delta[f.name] = encoder(value) if encoder else _convert_from(value, options)
+    return delta
+
+
+def _unchanged(value, old, contents, deltas):
+    stack = [(value, old, contents)]
+    while stack:
+        value, old, contents = stack.pop()
+        if value is not old:
+            return False
+        if contents is None:
+            if dataclasses.is_dataclass(value) and deltas.get(id(value)) != {}:
+                return False
+        elif len(value) != len(contents):
+            return False
+        elif isinstance(value, dict):
+            for (key, item), (old_key, old_item, item_contents) in zip(value.items(), contents):
+                if key != old_key:
+                    return False
+                stack.append((item, old_item, item_contents))
+        else:
+            stack += [(item, old_item, item_contents) for item, (old_item, item_contents) in zip(value, contents)]
+    return True
+
+
+def from_dict_many(ds: typing.Iterable[dict], t: Type[T], ignore_extras: bool = True,
+                   validate: bool = True) -> typing.List[T]:
+    """
+    Convert every dict in ds into an instance of the dataclass t. The decoder
+    for t is only looked up once for the whole batch.
+
+    Example:
+
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...
+    >>> from_dict_many([{'name': 'Howard'}, {'name': 'Bob'}], Person)
+    [Person(name='Howard'), Person(name='Bob')]
+    """
+    return list(iter_from_dict(ds, t, ignore_extras, validate))
+
+
+def iter_from_dict(ds: typing.Iterable[dict], t: Type[T], ignore_extras: bool = True,
+                   validate: bool = True) -> typing.Iterator[T]:
+    """
+    Lazily convert every dict in ds into an instance of the dataclass t.
+    Unlike `from_dict_many` this doesn't hold on to the results, so it can be
+    used on unbounded streams. See `from_dict` for validate.
+    """
+    if not dataclasses.is_dataclass(t):
+        raise HowardError("Second argument must be a dataclass")
+
+    options = _Options(ignore_extras or not validate, validate=validate, profile=_profiler is not None)
+    return _iter_decode(ds, _get_decoder(t, options))
+
+
+def _iter_decode(ds, decode):
+    for d in ds:
+        if not isinstance(d, dict):
+            raise HowardError("Every item must be of type dict")
+        yield decode(d)
+
+
+def to_dict_many(objs: typing.Iterable[T], public_only=False) -> typing.List[dict]:
+    """
+    Marshall every dataclass instance in objs into a dict
+
+    Example:
+
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...
+    >>> to_dict_many([Person(name='Howard'), Person(name='Bob')])
+    [{'name': 'Howard'}, {'name': 'Bob'}]
+    """
+    return list(iter_to_dict(objs, public_only))
+
+
+def iter_to_dict(objs: typing.Iterable[T], public_only=False) -> typing.Iterator[dict]:
+    """ Lazily marshall every dataclass instance in objs into a dict """
+    options = _EncodeOptions(public_only, profile=_profiler is not None)
+    cls = encode = None
+    for obj in objs:
+        if obj.__class__ is not cls:
+            # batches are usually homogeneous, only resolve when the class changes
+            if not dataclasses.is_dataclass(obj):
+                raise HowardError('Every item must be a dataclass')
+            cls = obj.__class__
+            encode = _encoders.get((cls, options)) or _get_encoder(cls, options)
+        yield encode(obj)
+
+
+def parallel_from_dict(items: typing.Iterable[typing.Union[dict, str, bytes]], t: Type[T],
+                       workers: typing.Optional[int] = None, chunksize: int = 1000,
+                       ordered: bool = True, ignore_extras: bool = True,
+                       executor: typing.Optional['futures.Executor'] = None) -> typing.Iterator[T]:
+    """
+    Convert items into instances of the dataclass t using a pool of worker
+    processes. Items can be dicts, or json documents as str or bytes, which
+    are then parsed in the workers too. They are sent to the workers in chunks
+    of chunksize items, with at most two chunks per worker in flight, so items
+    can be an unbounded stream.
+
+    With ordered=False, results are yielded as soon as their chunk is done
+    rather than in the order of items. t must be importable by the workers,
+    i.e. defined at the top level of a module. An existing executor can be
+    passed in instead of starting a new pool with the given number of workers.
+    """
+    if not dataclasses.is_dataclass(t):
+        raise HowardError("Second argument must be a dataclass")
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    return _parallel_decode(items, t, _Options(ignore_extras), workers, chunksize, ordered, executor)
+
+
+def _parallel_decode(items, t, options, workers, chunksize, ordered, executor):
+    from concurrent import futures  # slow to import, and only needed here
+
+    pool = executor or futures.ProcessPoolExecutor(workers)
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    items = iter(items)
+    pending = collections.deque()
+    try:
+        for chunk in iter(lambda: list(itertools.islice(items, chunksize)), []):
+            pending.append(pool.submit(_decode_chunk, chunk, t, options))
+            if len(pending) >= max_pending:
+                yield from _next_results(pending, ordered)
+        while pending:
+            yield from _next_results(pending, ordered)
+    finally:
+        for future in pending:
+            future.cancel()
+        if executor is None:
+            pool.shutdown()
+
+
+def _next_results(pending, ordered):
+    """ Take the results of the oldest chunk, or of the chunks that finished first """
+    if ordered:
+        return pending.popleft().result()
+    from concurrent import futures
+
+    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+    results = []
+    for future in done:
+        pending.remove(future)
+        results.extend(future.result())
+    return results
+
+
+def _decode_chunk(chunk, t, options):
+    decode = _get_decoder(t, options)
+    result = []
+    for d in chunk:
+        if isinstance(d, (str, bytes)):
+            d = json.loads(d)
+        if not isinstance(d, dict):
+            raise HowardError("Every item must be of type dict")
+        result.append(decode(d))
+    return result
 
+
+def from_records_columnar(records: typing.Iterable[dict], t: Type[T],
+                          ignore_extras: bool = True) -> 'ColumnBatch[T]':
+    """
+    Decode dicts into columns, one per field of the dataclass t, instead of
+    into one instance per dict. int, float and bool fields are stored in
+    `array.array`s, enums as the index of their member, and datetimes as
+    microseconds since the epoch. Other fields are kept in lists.
+
+    Example:
+
+    >>> @dataclasses.dataclass
+    ... class Point:
+    ...     x: int
+    ...     y: float
+    ...
+    >>> batch = from_records_columnar([{'x': 1, 'y': 2.5}, {'x': 2, 'y': 0.5}], Point)
+    >>> batch.column('x')
+    array('q', [1, 2])
+    >>> batch[1]
+    Point(x=2, y=0.5)
+    """
+    if not dataclasses.is_dataclass(t):
+        raise HowardError("Second argument must be a dataclass")
+
+    options = _Options(ignore_extras)
+    types = _type_hints(t, strict=True)
+    columns = [_Column(f, types[f.name], options) for f in dataclasses.fields(t) if f.init]
+    names = frozenset(types)
+    for d in records:
+        if not isinstance(d, dict):
+            raise HowardError("Every item must be of type dict")
+        for column in columns:
+            column.append(d)
         if not ignore_extras:
-            extras = set(obj.keys()) - set(kwargs.keys())
+            extras = set(d.keys()) - names
             if extras:
-                raise HowardError(
-                    f'Found unexpected keys {extras} when converting to {t}'
-                )
-        return t(**kwargs)
+                raise HowardError('Found unexpected keys {value} when converting to {expected}', extras, t)
+    return ColumnBatch(t, columns)
 
-    elif t == dict:
-        return _convert_to(obj, typing.Dict[typing.Any, typing.Any], ignore_extras=ignore_extras)
-    elif t == list:
-        return _convert_to(obj, typing.List[typing.Any], ignore_extras=ignore_extras)
-    elif typing.get_origin(t):  # A typing "mask" type, i.e List/Dict
-        args = typing.get_args(t)
-        real_type = typing.get_origin(t)
 
-        if real_type == Union:
-            if type(None) in args and obj is None:
-                # an `Optional[x]` type or `Union[x, y, None]` type
-                if obj is None:
-                    return obj
-            for arg in args:
-                try:
-                    return _convert_to(obj, arg, ignore_extras=ignore_extras)
-                except HowardError:
-                    continue
-            raise HowardError(f'{obj} could not be converted to any type in: '
-                            f'{", ".join(f"{a}" for a in args)}')
+class ColumnBatch(typing.Generic[T]):
+    """
+    Records of one dataclass stored as a column per field, as returned by
+    `from_records_columnar`. Indexing or iterating creates instances on demand.
+    The arrays returned by `column` support the buffer protocol, so they can be
+    wrapped without copying, e.g. with `numpy.frombuffer`.
+    """
 
-        if real_type == typing.Literal:
-            if obj not in args:
-                raise HowardError(f'Invalid value "{obj}". Must be one of: {", ".join(args)}')
-            return obj
+    def __init__(self, t: Type[T], columns):
+        self.type = t
+        self._columns = {c.name: c for c in columns}
+        self._length = len(columns[0].data) if columns else 0
 
-        # validate
-        if not isinstance(obj, real_type):
-            raise HowardError(f'Object "{obj}" not of expected type {real_type}')
+    def __len__(self):
+        return self._length
 
-        if real_type == list:
-            return [
-                _convert_to(i, args[0], ignore_extras=ignore_extras)
-                for i in obj
-            ]
-        elif real_type == dict:
-            return {
-                _convert_to(k, args[0], ignore_extras=ignore_extras):
-                    _convert_to(v, args[1], ignore_extras=ignore_extras)
-                for k, v in obj.items()
-            }
+    def __getitem__(self, i: int) -> T:
+        if not -self._length <= i < self._length:
+            raise IndexError('ColumnBatch index out of range')
+        return self.type(**{name: c.get(i) for name, c in self._columns.items()})
+
+    def __iter__(self) -> typing.Iterator[T]:
+        return (self[i] for i in range(self._length))
+
+    def __repr__(self):
+        return f'ColumnBatch({self.type.__qualname__}, {self._length} records)'
+
+    @property
+    def names(self) -> typing.List[str]:
+        return list(self._columns)
+
+    def column(self, name: str):
+        """ The storage for a field, an `array.array` or a list """
+        return self._columns[name].data
+
+    def values(self, name: str) -> list:
+        """ The values of a field, converted back to their python type """
+        column = self._columns[name]
+        if column.load is None:
+            return list(column.data)
+        return [column.load(v) for v in column.data]
+
+
+_epoch = datetime(1970, 1, 1)
+_epoch_utc = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_microsecond = timedelta(microseconds=1)
+
+
+class _Column:
+    """ Storage for a single field in a ColumnBatch """
+
+    def __init__(self, f, field_type, options):
+        self.name = f.name
+        self.decode = _field_decoder(f, field_type, options) or _get_decoder(field_type, options)
+        if f.default is not dataclasses.MISSING:
+            self.default = lambda: f.default
+        elif f.default_factory is not dataclasses.MISSING:
+            self.default = f.default_factory
         else:
-            raise HowardError(
-                'Type {real_type} currently not supported by howard. '
-                'Consider making a PR.'
-            )
-    elif isinstance(t, typing._TypedDictMeta):
-        # is a TypedDict
-        result = {}
-        for key, value in typing.get_type_hints(t).items():
-            if key not in obj:
-                if t.__total__:
-                    raise HowardError(f'Object "{obj}" is missing required key: {key}')
-            else:
-                result[key] = _convert_to(obj[key], value, ignore_extras=ignore_extras)
-        hints = typing.get_type_hints(t)
-        if not ignore_extras:
-            for key in obj:
-                if key not in hints:
-                    raise HowardError(f'Found unexpected key {key} when converting to {t}')
-        return result
+            self.default = None
+        # `store` turns a decoded value into what is kept in data, `load` reverses it
+        self.store = self.load = None
+        self.aware = None
 
-    elif isinstance(t, EnumMeta):
-        return t(obj)
-    elif hasattr(t, '__supertype__'):
-        # is a Vanity type, such as `A = NewType('A', str)`
-        return _convert_to(obj, t.__supertype__, ignore_extras=ignore_extras)
-    elif t in (int, str, bool, float):
-        if not isinstance(obj, t):
-            raise HowardError(f'Object "{obj}" not of expected type {t}')
-        return t(obj)
-    elif t is datetime:
-        return dateutil.parser.parse(obj)
-    else:
-        # not supported type, attempt to use parent classes
-        for p in t.__bases__:
-            if p == object:
+        field_type = _unwrap_newtype(field_type)
+        typed = field_type in (bool, int, float, datetime) or isinstance(field_type, EnumMeta)
+        if not typed or (f.default is not dataclasses.MISSING and not isinstance(f.default, field_type)):
+            self.data = []  # i.e. defaults to None, needs an object column
+        elif field_type is bool:
+            self.data = array.array('b')
+            self.load = bool
+        elif field_type is int:
+            self.data = array.array('q')
+        elif field_type is float:
+            self.data = array.array('d')
+        elif isinstance(field_type, EnumMeta):
+            members = list(field_type)
+            indexes = {m: i for i, m in enumerate(members)}
+            self.data = array.array('l')
+            self.store = indexes.__getitem__
+            self.load = members.__getitem__
+        elif field_type is datetime:
+            self.data = array.array('q')
+            self.store = self._store_datetime
+            self.load = self._load_datetime
+
+    def append(self, d):
+        try:
+            value = self.decode(d[self.name])
+        except KeyError:
+            if self.default is None:
+                raise _missing_key(d)._at(self.name) from None
+            value = self.default()
+        except HowardError as e:
+            raise e._at(self.name)
+        if self.store is not None:
+            value = self.store(value)
+        try:
+            self.data.append(value)
+        except OverflowError:
+            raise HowardError('Value {value} does not fit in a 64 bit column', value)._at(self.name) from None
+
+    def get(self, i):
+        value = self.data[i]
+        return value if self.load is None else self.load(value)
+
+    def _store_datetime(self, value):
+        aware = value.tzinfo is not None
+        if self.aware is None:
+            self.aware = aware
+        elif self.aware != aware:
+            raise HowardError(f'Cant mix naive and timezone aware datetimes in "{self.name}"')
+        return (value - (_epoch_utc if aware else _epoch)) // _microsecond
+
+    def _load_datetime(self, value):
+        return (_epoch_utc if self.aware else _epoch) + value * _microsecond
+
+
+def load_ndjson(fp: typing.IO, t: Type[T], ignore_extras: bool = True) -> typing.Iterator[T]:
+    """
+    Lazily read newline delimited json from the file (or mmap) fp and convert
+    every line into an instance of the dataclass t. Blank lines are skipped.
+
+    Example:
+
+    >>> import io
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...
+    >>> list(load_ndjson(io.BytesIO(b'{"name": "Howard"}\\n{"name": "Bob"}\\n'), Person))
+    [Person(name='Howard'), Person(name='Bob')]
+    """
+    return iter_from_dict(_iter_ndjson(fp), t, ignore_extras)
+
+
+def iter_json_array(fp: typing.IO, t: Type[T], ignore_extras: bool = True,
+                    chunk_size: int = 65536) -> typing.Iterator[T]:
+    """
+    Lazily read a top level json array from the file (or mmap) fp and convert
+    every item into an instance of the dataclass t. Only a chunk of the file
+    and the item being decoded are held in memory at a time.
+
+    Example:
+
+    >>> import io
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...
+    >>> list(iter_json_array(io.BytesIO(b'[{"name": "Howard"}, {"name": "Bob"}]'), Person))
+    [Person(name='Howard'), Person(name='Bob')]
+    """
+    return iter_from_dict(_iter_json_array(fp, chunk_size), t, ignore_extras)
+
+
+async def aiter_decode(reader: 'asyncio.StreamReader', t: Type[T], ignore_extras: bool = True,
+                       executor: typing.Optional['futures.Executor'] = None,
+                       chunk_size: int = 65536) -> typing.AsyncIterator[T]:
+    """
+    Read newline delimited json, or a top level json array, from the asyncio
+    stream reader and yield an instance of the dataclass t for every record
+    as soon as it has arrived. Which of the two it is, is told from the first
+    character. Only a chunk of the stream is held in memory at a time.
+
+    With an executor, such as a ThreadPoolExecutor, every chunk is parsed and
+    decoded in it, so that big chunks dont block the event loop.
+
+    Example:
+
+    >>> import asyncio
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...
+    >>> async def main():
+    ...     reader = asyncio.StreamReader()
+    ...     reader.feed_data(b'{"name": "Howard"}\\n{"name": "Bob"}\\n')
+    ...     reader.feed_eof()
+    ...     return [person async for person in aiter_decode(reader, Person)]
+    ...
+    >>> asyncio.run(main())
+    [Person(name='Howard'), Person(name='Bob')]
+    """
+    import asyncio  # slow to import, and only needed here
+
+    if not dataclasses.is_dataclass(t):
+        raise HowardError("Second argument must be a dataclass")
+
+    decode = _get_decoder(t, _Options(ignore_extras))
+    loop = asyncio.get_running_loop()
+    parser = None
+    head = b''
+
+    def parse(data):
+        parser.feed(data)
+        return list(_iter_decode(parser.items(), decode))
+
+    while parser is None or not parser.done:
+        data = await reader.read(chunk_size if parser is None else parser.want())
+        if parser is None:
+            head += data
+            if data and not head.strip():
+                continue  # only whitespace so far
+            parser = _JsonArrayReader(chunk_size) if head.lstrip()[:1] == b'[' else _NdjsonReader(chunk_size)
+            data, head = head, b''
+        if executor is None:
+            records = parse(data)
+        else:
+            records = await loop.run_in_executor(executor, parse, data)
+        for record in records:
+            yield record
+        if not data:
+            return
+
+
+class _NdjsonReader:
+    """ Incrementally parse newline delimited json, like _JsonArrayReader """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.buf = b''
+        self.done = False
+
+    def feed(self, data):
+        """ Add data to the buffer, empty data signals the end of input """
+        self.buf += data
+        self.done = not data
+
+    def items(self):
+        lines = self.buf.split(b'\n')
+        # the last line is incomplete until the end of input
+        self.buf = b'' if self.done else lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+    def want(self):
+        return self.chunk_size
+
+
+def _iter_ndjson(fp):
+    while True:
+        line = fp.readline()
+        if not line:
+            return
+        if line.strip():
+            yield json.loads(line)
+
+
+class _JsonArrayReader:
+    """ Incrementally parse the items of a top level json array """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.started = False
+        self.need_comma = False
+        self.need_item = False
+        self.closed = False
+        self.done = False
+
+    def feed(self, data):
+        """ Add data to the buffer, empty data signals the end of input """
+        if self.pos > self.chunk_size:
+            self.buf = self.buf[self.pos:]  # drop what is already parsed
+            self.pos = 0
+        if isinstance(data, bytes):
+            data = self.utf8.decode(data, final=not data)
+        self.buf += data
+        self.eof = self.eof or not data
+
+    def items(self):
+        """ Yield every item that can be parsed from the current buffer """
+        while not self.done:
+            if self.closed:
+                # like `json.load`, only whitespace may follow the array
+                while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                    self.pos += 1
+                if self.pos < len(self.buf):
+                    raise json.JSONDecodeError('Extra data', self.buf, self.pos)
+                self.done = self.eof
+                return
+            if not self._skip_ws():
+                return
+            if not self.started:
+                if self.buf[self.pos] != '[':
+                    raise json.JSONDecodeError('Expecting a json array', self.buf, self.pos)
+                self.started = True
+                self.pos += 1
                 continue
-            try:
-                return t(_convert_to(obj, p, ignore_extras=ignore_extras))
-            except TypeError:
+            char = self.buf[self.pos]
+            if char == ']' and not self.need_item:
+                self.pos += 1
+                self.closed = True
                 continue
+            if self.need_comma:
+                if char != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", self.buf, self.pos)
+                self.pos += 1
+                self.need_comma = False
+                self.need_item = True
+                continue
+            try:
+                item, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                return  # the item is incomplete, wait for more data
+            if end == len(self.buf) and not self.eof:
+                return  # numbers and literals may continue in the next chunk
+            self.need_comma = True
+            self.need_item = False
+            self.pos = end
+            yield item
 
-        raise HowardError(f'Unsupported type {t}')
+    def _skip_ws(self):
+        while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+            self.pos += 1
+        if self.pos < len(self.buf):
+            return True
+        if self.eof:
+            raise json.JSONDecodeError('Unexpected end of json array', self.buf, self.pos)
+        return False
 
+    def want(self):
+        """ How much to read next, grows with the unparsed part of the buffer """
+        return max(self.chunk_size, len(self.buf) - self.pos)
 
-def _convert_from(obj, public=False):
-    if dataclasses.is_dataclass(obj):
-        d = {}
-        for f in dataclasses.fields(obj):
-            if f.name.startswith('_') and public:
-                continue  # these attributes dont make it into the dict
-            if f.metadata.get('internal', False):
-                continue  # these attributes are marked as internal
-            encoder = f.metadata.get('howard', {}).get('encoder')
-            if encoder:
-                d[f.name] = encoder(getattr(obj, f.name))
-            else:
-                d[f.name] = _convert_from(getattr(obj, f.name), public=public)
-        return d
-    elif isinstance(obj, list):
-        return [_convert_from(i, public=public) for i in obj]
-    elif isinstance(obj, dict):
-        return {k: _convert_from(v, public=public) for k, v in obj.items()}
-    elif isinstance(obj.__class__, EnumMeta):
-        return _convert_from(obj.value, public=public)
-    elif type(obj) in (int, str, bool, float):
-        return obj
-    elif obj is None:
-        return obj
-    elif type(obj) is datetime:
-        return obj.isoformat()
-    else:
-        raise HowardError(f'Unsupported type {type(obj)}')
+
+def _iter_json_array(fp, chunk_size):
+    reader = _JsonArrayReader(chunk_size)
+    while not reader.done:
+        reader.feed(fp.read(reader.want()))
+        yield from reader.items()
+
+
+def dumps(obj: T, public_only=False) -> str:
+    """
+    Serialize a dataclass instance to a json string. The result is the same as
+    `json.dumps(to_dict(obj))`, but lists and dicts that hold only plain values
+    are encoded as they are instead of being copied first.
+
+    Example:
+
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...     age: int
+    ...
+    >>> dumps(Person(name='Howard', age=24))
+    '{"name": "Howard", "age": 24}'
+    """
+    if not dataclasses.is_dataclass(obj):
+        raise HowardError('Argument must be a dataclass')
+
+    return _json_encoder.encode(_convert_from(obj, _EncodeOptions(public_only, copy=False)))
+
+
+def dump(obj: T, fp: typing.IO, public_only=False, buffer_size: int = 65536):
+    """
+    Serialize a dataclass instance as json into the text or binary file fp.
+    Output is written in chunks of at most buffer_size characters.
+    """
+    s = dumps(obj, public_only)
+    binary = isinstance(fp, (io.RawIOBase, io.BufferedIOBase))
+    for start in range(0, len(s), buffer_size):
+        chunk = s[start:start + buffer_size]
+        fp.write(chunk.encode() if binary else chunk)
+
+
+# Encodes like `json.dumps` with its default arguments, with the C encoder
+_json_encoder = json.JSONEncoder()
+
+
+def compile(t: Type[T]) -> Type[T]:
+    """
+    Generate specialized python code for converting the dataclass t, and any
+    dataclasses it references, to and from dicts. Afterwards `from_dict` and
+    `to_dict` use the generated code for these types. Returns t, so it can
+    also be used as a class decorator.
+
+    Example:
+
+    >>> @compile
+    ... @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...     age: int
+    ...
+    >>> from_dict({'name': 'Howard', 'age': 24}, Person)
+    Person(name='Howard', age=24)
+    """
+    if not dataclasses.is_dataclass(t):
+        raise HowardError("Argument must be a dataclass")
+
+    compiled = set(_compiled)
+    _collect_dataclasses(t, _compiled)
+    # previously built plans may hold on to the non-compiled versions
+    added = _compiled - compiled
+    _forget_plans(lambda cls: cls in added, _decoders, _patchers, _encoders)
+    if _unresolved(t) is None:
+        _get_decoder(t, _Options())
+        _get_encoder(t, _EncodeOptions())
+    # else it refers to classes that dont exist yet, built on first use instead
+    return t
+
+
+def intern(t: Type[T] = None, *, maxsize: int = 1024) -> Type[T]:
+    """
+    Share the instances `from_dict` builds of the frozen dataclass t between
+    equal inputs. The maxsize most recently used values are remembered, keyed
+    on their content, so decoding one of them again returns the same instance
+    instead of building a new one. Instances holding unhashable values, like
+    lists, are never shared. Enum members are always shared already.
+    Returns t, so it can also be used as a class decorator.
+
+    Example:
+
+    >>> @intern(maxsize=256)
+    ... @dataclasses.dataclass(frozen=True)
+    ... class Suit:
+    ...     name: str
+    ...
+    >>> from_dict({'name': 'spades'}, Suit) is from_dict({'name': 'spades'}, Suit)
+    True
+    """
+    if t is None:
+        return functools.partial(intern, maxsize=maxsize)
+    if isinstance(t, EnumMeta):
+        return t
+    if not dataclasses.is_dataclass(t):
+        raise HowardError("Argument must be a dataclass")
+    if not t.__dataclass_params__.frozen:
+        raise HowardError("Only instances of frozen dataclasses can be shared")
+
+    _interned[t] = maxsize
+    # previously built plans may hold on to the decoder without the cache
+    _forget_plans(lambda cls: cls is t, _decoders, _patchers)
+    return t
+
+
+# Maximum number of cached instances of the dataclasses passed to `intern`
+_interned = {}
+
+
+def _interning(decode, maxsize):
+    cache = collections.OrderedDict()
+
+    def decode_interned(obj):
+        key = _content_key(obj)
+        try:
+            instance = cache[key]
+        except KeyError:
+            instance = decode(obj)
+            if not _immutable(instance):
+                return instance  # sharing it would share its lists and dicts too
+            cache[key] = instance
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+            return instance
+        except TypeError:  # unhashable content, cant be cached
+            return decode(obj)
+        try:
+            cache.move_to_end(key)
+        except KeyError:  # evicted by another thread in the meantime
+            pass
+        return instance
+    return decode_interned
+
+
+def _immutable(instance):
+    """ Whether every field of the frozen dataclass instance holds a hashable value """
+    try:
+        hash(tuple([getattr(instance, f.name) for f in dataclasses.fields(instance)]))
+    except TypeError:
+        return False
+    return True
+
+
+def _content_key(obj):
+    """ A hashable key for obj, equal only for values with the same content and types """
+    cls = obj.__class__
+    if cls is dict:
+        return cls, tuple([(k.__class__, k, _content_key(v)) for k, v in obj.items()])
+    if cls is list:
+        return cls, tuple([_content_key(v) for v in obj])
+    return cls, obj
+
+
+def register(*types: type, compiled: bool = False) -> None:
+    """
+    Prepare everything needed to convert the dataclasses types, and the ones
+    they refer to, now instead of on first use, e.g. at import time or in a
+    warmup step before serving requests. With compiled=True, they are also
+    passed to `compile`.
+
+    Dataclasses whose annotations refer to classes that dont exist yet are
+    prepared once they do, by a later call. Calling it without types
+    prepares these, and raises if that is still not possible.
+
+    Example:
+
+    >>> @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...
+    >>> register(Person)
+    """
+    for t in types:
+        if not dataclasses.is_dataclass(t):
+            raise HowardError('Arguments must be dataclasses')
+    _registered.extend((t, compiled) for t in types)
+    pending = list(_registered)
+    _registered.clear()
+    unresolved = None
+    for t, compile_t in pending:
+        error = _unresolved(t)
+        if error is not None:
+            unresolved = unresolved or (t, error)
+            _registered.append((t, compile_t))
+            continue
+        if compile_t:
+            compile(t)
+        found = set()
+        _collect_dataclasses(t, found)
+        _get_decoder(t, _Options())
+        for cls in found:
+            _get_encoder(cls, _EncodeOptions())
+            _get_encoder(cls, _EncodeOptions(copy=False))  # used by `dumps`
+    if unresolved and not types:
+        raise HowardError(f'Cant resolve the annotations of {unresolved[0]}: {unresolved[1]}')
+
+
+def model(t: Type[T] = None, *, compiled: bool = False) -> Type[T]:
+    """
+    Class decorator that `register`s the dataclass t. Put it above
+    @dataclass, so it sees the dataclass.
+
+    Example:
+
+    >>> @model
+    ... @dataclasses.dataclass
+    ... class Person:
+    ...     name: str
+    ...
+    """
+    if t is None:
+        return functools.partial(model, compiled=compiled)
+    register(t, compiled=compiled)
+    return t
+
+
+# (dataclass, compile) of registered dataclasses that couldnt be prepared yet
+_registered = []
+
+
+def _unresolved(t):
+    """ The error resolving annotations of t or a dataclass it refers to, if any """
+    seen = set()
+    todo = [t]
+    while todo:
+        t = todo.pop()
+        if t in seen:
+            continue
+        seen.add(t)
+        try:
+            hints = typing.get_type_hints(t, localns={t.__name__: t})
+        except NameError as e:
+            return e
+        except TypeError:
+            continue
+        stack = list(hints.values())
+        while stack:
+            hint = stack.pop()
+            if dataclasses.is_dataclass(hint) or isinstance(hint, typing._TypedDictMeta):
+                todo.append(hint)
+            else:
+                stack.extend(typing.get_args(hint))
+    return None
+
+
+def register_type(t: type, decode: typing.Callable = None, encode: typing.Callable = None) -> None:
+    """
+    Convert values of the class t, and of its subclasses, with the given
+    functions. decode gets the json value and returns an instance of t,
+    encode gets an instance and returns a json value. Either can be left
+    out. A decoder registered for a parent class is used for subclasses too,
+    its result is passed to the subclass if it is not already an instance.
+
+    Example:
+
+    >>> import decimal
+    >>> register_type(decimal.Decimal, decode=decimal.Decimal, encode=str)
+    >>> @dataclasses.dataclass
+    ... class Price:
+    ...     amount: decimal.Decimal
+    ...
+    >>> from_dict({'amount': '9.99'}, Price)
+    Price(amount=Decimal('9.99'))
+    >>> to_dict(Price(decimal.Decimal('0.50')))
+    {'amount': '0.50'}
+    """
+    if not isinstance(t, type):
+        raise HowardError("Argument must be a class")
+    if t in _plain_values or t in (list, dict) or dataclasses.is_dataclass(t):
+        raise HowardError(f"Converters for {t.__name__} cant be replaced")
+    if decode is None and encode is None:
+        raise HowardError("Either decode or encode is required")
+
+    if decode is not None:
+        _type_decoders[t] = decode
+    if encode is not None:
+        _type_encoders[t] = encode
+    # previously built plans may use the converters of a parent class or the defaults.
+    # Walking deep dataclasses picks encoders by the class of each value, so theirs go too.
+    _forget_plans(lambda cls: issubclass(cls, t) or dataclasses.is_dataclass(cls) and _is_recursive(cls),
+                  _decoders, _patchers, _encoders)
+
+
+def _forget_plans(affected, *caches):
+    """
+    Drop the plans in caches that were built for types that are, or refer to,
+    a class for which affected(cls) is true. Plans for other types are kept.
+    """
+    for cache in caches:
+        for key in list(cache):
+            if _refers_to(key[0], affected):
+                cache.pop(key, None)
+
+
+def _refers_to(t, affected):
+    """ Whether affected(cls) is true for t or a class in its arguments or fields """
+    seen = set()
+    todo = [t]
+    while todo:
+        t = todo.pop()
+        try:
+            if t in seen:
+                continue
+            seen.add(t)
+        except TypeError:  # not a type, i.e. an unhashable Literal or Annotated value
+            continue
+        if isinstance(t, type) and typing.get_origin(t) is None and affected(t):
+            return True
+        if dataclasses.is_dataclass(t) or isinstance(t, typing._TypedDictMeta):
+            todo.extend(_type_hints(t).values())
+        todo.extend(typing.get_args(t))
+        todo.append(getattr(t, '__supertype__', None))  # NewType
+    return False
+
+
+# Functions passed to `register_type`, keyed by class. Plans look them up once, through
+# the mro of the class they are built for, so using them is a dict lookup like any plan.
+_type_decoders = {}
+_type_encoders = {}
+
+
+def _registered_converter(converters, t):
+    if converters and isinstance(t, type):
+        for cls in t.__mro__:
+            if cls in converters:
+                return cls, converters[cls]
+    return None, None
+
+
+class Profile:
+    """ Call counts, time and allocations recorded while profiling conversions """
+
+    def __init__(self):
+        # (direction, type name, field name or None) -> [calls, seconds, blocks]
+        self._stats = collections.defaultdict(lambda: [0, 0.0, 0])
+
+    def _record(self, key, seconds, blocks):
+        stats = self._stats[key]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] += blocks
+
+    def as_dict(self) -> dict:
+        """ The recorded stats, grouped by direction, dataclass and field
+
+        >>> @dataclasses.dataclass
+        ... class Point:
+        ...     x: int
+        >>> with profile() as p:
+        ...     point = from_dict({'x': 1}, Point)
+        >>> stats = p.as_dict()['decode']['howard.Point']
+        >>> stats['calls'], stats['fields']['x']['calls']
+        (1, 1)
+        """
+        result = {'decode': {}, 'encode': {}}
+        for (direction, name, field), (calls, seconds, blocks) in self._stats.items():
+            entry = result[direction].setdefault(name, {'calls': 0, 'time': 0.0, 'blocks': 0, 'fields': {}})
+            stats = {'calls': calls, 'time': seconds, 'blocks': blocks}
+            if field is None:
+                entry.update(stats)
+            else:
+                entry['fields'][field] = stats
+        return result
+
+
+# The Profile collecting stats, or None when profiling is off. The entry points
+# only check this once per call, so disabled profiling costs nothing per field.
+_profiler = None
+
+
+@contextlib.contextmanager
+def profile() -> typing.Iterator[Profile]:
+    """ Record per dataclass and per field stats for conversions inside the block
+
+    Covers from_dict, iter_from_dict, to_dict and iter_to_dict (and the *_many
+    variants). Time is wall clock time including nested conversions, blocks is
+    the net change in allocated memory blocks. Compiled dataclasses fall back
+    to their regular plans while profiled. Data nested too deep for the plans
+    is still converted, but not recorded.
+    """
+    global _profiler
+    previous, _profiler = _profiler, Profile()
+    try:
+        yield _profiler
+    finally:
+        _profiler = previous
+
+
+def _profiled(direction, t, field, fn):
+    key = (direction, f'{t.__module__}.{t.__qualname__}', field)
+
+    def profiled(obj):
+        profiler = _profiler
+        if profiler is None:
+            return fn(obj)
+        blocks = sys.getallocatedblocks()
+        start = _time.perf_counter()
+        result = fn(obj)
+        profiler._record(key, _time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+        return result
+    return profiled
+
+
+def _convert_to(obj, t, ignore_extras=True):
+    return _get_decoder(t, _Options(ignore_extras))(obj)
+
+
+class _Options(typing.NamedTuple):
+    """ Settings that change how decoder plans are built """
+    ignore_extras: bool = True
+    lazy: bool = False
+    copy: bool = True
+    validate: bool = True
+    profile: bool = False
+    all_errors: bool = False
+    compiled: bool = True
+
+
+# Decoder plans, keyed by (type, options, discriminator). Each plan is a callable that
+# takes the raw value and returns the converted one. Plans are built the first
+# time a type is seen, so the type introspection only happens once per type.
+_decoders = {}
+
+
+# Plans the current thread is building. They are only added to _decoders once the
+# outermost one is complete, so other threads never pick up a plan that is still
+# being filled in, e.g. the placeholder of a self-referencing dataclass.
+_building = threading.local()
+
+
+def _get_decoder(t, options, discriminator=None):
+    key = (t, options, discriminator)
+    try:
+        return _decoders[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable type annotation, cant be cached
+        return _build_decoder(t, options, discriminator, key=None)
+
+    building = getattr(_building, 'decoders', None)
+    if building is None:
+        _building.decoders = building = {}
+        try:
+            decoder = _get_decoder(t, options, discriminator)
+        finally:
+            del _building.decoders
+        _decoders.update(building)
+        return decoder
+    try:
+        return building[key]
+    except KeyError:
+        pass
+    decoder = building[key] = _build_decoder(t, options, discriminator, key=key)
+    return decoder
+
+
+def _build_decoder(t, options, discriminator, key):
+    if t == typing.Any:
+        return _decode_any
+    if dataclasses.is_dataclass(t):
+        # register a forwarder before building the field plans, so self-referencing
+        # dataclasses resolve to the finished decoder instead of recursing forever
+        finished = []
+        if key is not None:
+            _building.decoders[key] = lambda obj: finished[0](obj)
+        decoder = _build_dataclass_decoder(t, options)
+        if t in _interned:
+            decoder = _interning(decoder, _interned[t])
+        if not _lazy_fields(t, options) and _is_recursive(t):
+            # values walked for being too deep arent shared
+            decoder = _walk_when_deep(decoder, _decode_node(t, options, {}))
+        finished.append(decoder)
+        return decoder
+    elif t == dict:
+        return _get_decoder(typing.Dict[typing.Any, typing.Any], options)
+    elif t == list:
+        return _get_decoder(typing.List[typing.Any], options)
+    elif typing.get_origin(t):  # A typing "mask" type, i.e List/Dict
+        args = typing.get_args(t)
+        real_type = typing.get_origin(t)
+
+        if real_type == Union:
+            return _build_union_decoder(args, options, discriminator)
+
+        if real_type == typing.Literal:
+            if not options.validate:
+                return _decode_any
+
+            def decode_literal(obj):
+                if obj not in args:
+                    raise HowardError('Invalid value "{value}". Must be one of: {expected}', obj, t)
+                return obj
+            return decode_literal
+
+        if real_type == list:
+            decode_item = _get_decoder(args[0], options, discriminator)
+            plain_items = _plain_classes(args[0])
+
+            if not options.validate:
+                def decode_trusted_list(obj):
+                    if plain_items is not None:
+                        return list(obj) if options.copy else obj
+                    items = iter(obj)
+                    try:
+                        return [decode_item(i) for i in items]
+                    except HowardError as e:
+                        raise e._at(_failed_index(obj, items))
+                return decode_trusted_list
+
+            def decode_list(obj):
+                if not isinstance(obj, list):
+                    raise HowardError('Object "{value}" not of expected type {expected}', obj, real_type)
+                if plain_items is not None and (plain_items is True or plain_items.issuperset(map(type, obj))):
+                    # nothing to convert, skip the per item calls
+                    return list(obj) if options.copy else obj
+                items = iter(obj)
+                try:
+                    return [decode_item(i) for i in items]
+                except HowardError as e:
+                    raise e._at(_failed_index(obj, items))
+
+            if options.all_errors:
+                return _collect_errors(decode_list, lambda obj: _item_errors(
+                    (i, decode_item, item) for i, item in enumerate(obj)))
+            return decode_list
+        elif real_type == dict:
+            decode_key = _get_decoder(args[0], options)
+            decode_value = _get_decoder(args[1], options, discriminator)
+            plain_keys = _plain_classes(args[0])
+            plain_values = _plain_classes(args[1])
+
+            if not options.validate:
+                def decode_trusted_dict(obj):
+                    if plain_keys is not None and plain_values is not None:
+                        return dict(obj) if options.copy else obj
+                    items = iter(obj.items())
+                    try:
+                        return {decode_key(k): decode_value(v) for k, v in items}
+                    except HowardError as e:
+                        raise e._at(_failed_key(obj, items))
+                return decode_trusted_dict
+
+            def decode_dict(obj):
+                if not isinstance(obj, dict):
+                    raise HowardError('Object "{value}" not of expected type {expected}', obj, real_type)
+                if (plain_keys is not None and plain_values is not None
+                        and (plain_keys is True or plain_keys.issuperset(map(type, obj)))
+                        and (plain_values is True or plain_values.issuperset(map(type, obj.values())))):
+                    return dict(obj) if options.copy else obj
+                items = iter(obj.items())
+                try:
+                    return {decode_key(k): decode_value(v) for k, v in items}
+                except HowardError as e:
+                    raise e._at(_failed_key(obj, items))
+
+            if options.all_errors:
+                return _collect_errors(decode_dict, lambda obj: _item_errors(
+                    (k, decoder, v) for k, value in obj.items()
+                    for decoder, v in ((decode_key, k), (decode_value, value))))
+            return decode_dict
+        else:
+            def decode_unsupported(obj):
+                if not isinstance(obj, real_type):
+                    raise HowardError('Object "{value}" not of expected type {expected}', obj, real_type)
+                raise HowardError(
+                    f'Type {real_type} currently not supported by howard. '
+                    'Consider making a PR.'
+                )
+            return decode_unsupported
+    elif isinstance(t, typing._TypedDictMeta):
+        return _build_typed_dict_decoder(t, options)
+    elif _registered_converter(_type_decoders, t)[1] is not None:
+        return _build_registered_decoder(t)
+    elif isinstance(t, EnumMeta):
+        return t
+    elif hasattr(t, '__supertype__'):
+        # is a Vanity type, such as `A = NewType('A', str)`
+        return _get_decoder(t.__supertype__, options, discriminator)
+    elif t in (int, str, bool, float):
+        if not options.validate:
+            return _decode_any
+
+        def decode_primitive(obj):
+            if not isinstance(obj, t):
+                raise HowardError('Object "{value}" not of expected type {expected}', obj, t)
+            return t(obj)
+        return decode_primitive
+    elif t is datetime:
+        return _decode_datetime
+    elif t is date:
+        return _decode_date
+    elif t is time:
+        return _decode_time
+    elif t is timedelta:
+        return _decode_timedelta
+    else:
+        return _build_subclass_decoder(t, options)
+
+
+def _missing_key(obj):
+    # the key is only in the path, callers add it like for any other error in the value
+    return HowardError('Object "{value}" is missing required key', obj)
+
+
+def _failed_index(obj, items):
+    """ The index of the item that failed, from how far the iterator over obj got """
+    return len(obj) - items.__length_hint__() - 1
+
+
+def _failed_key(obj, items):
+    return list(obj)[_failed_index(obj, items)]
+
+
+def _collect_errors(decode, find_errors):
+    """ Wrap decode so that when it fails, find_errors is used to report every error in the value """
+    def decode_all(obj):
+        try:
+            return decode(obj)
+        except HowardError as e:
+            if e._walked:
+                raise
+            errors = find_errors(obj)
+            if len(errors) < 2:
+                raise
+            raise HowardError(f'Found {len(errors)} errors', errors=errors) from None
+    return decode_all
+
+
+def _item_errors(items):
+    """ Errors from decoding each (path segment, decoder, value) in items """
+    errors = []
+    for segment, decode, value in items:
+        try:
+            decode(value)
+        except HowardError as e:
+            errors += e._at(segment)._flatten()
+    return errors
+
+
+def _decode_any(obj):
+    return obj
+
+
+def _plain_classes(t):
+    """
+    The classes of values that decode to themselves as type t, or True if any
+    value does (for Any). None if values of type t always need converting.
+    """
+    t = _unwrap_newtype(t)
+    if t == typing.Any:
+        return True
+    if t in (int, str, bool, float):
+        return frozenset([t])
+    optional = _optional_arg(t)
+    if optional is not None:
+        plain = _plain_classes(optional)
+        if isinstance(plain, frozenset):
+            return plain | {type(None)}
+        return plain
+    return None
+
+
+def _parse_iso(cls, obj):
+    try:
+        return cls.fromisoformat(obj)
+    except ValueError:
+        pass
+    rewritten = _rewrite_iso(obj)
+    if rewritten is None:
+        return None
+    try:
+        return cls.fromisoformat(rewritten)
+    except ValueError:
+        return None
+
+
+def _rewrite_iso(obj):
+    """
+    Rewrite an ISO 8601 datetime or time into the form `isoformat` writes,
+    which is all `fromisoformat` reads before python 3.11. Fractions of a
+    second of any length are cut to microseconds, and `Z`, `+hh` and `+hhmm`
+    offsets become `+hh:mm`.
+    """
+    match = _iso_time.fullmatch(obj)
+    if match is None:
+        return None
+    head, fraction, zulu, hours, minutes = match.groups()
+    if fraction:
+        head += '.' + fraction[:6].ljust(6, '0')
+    if zulu:
+        head += '+00:00'
+    elif hours:
+        head += f'{hours}:{minutes or "00"}'
+    return head
+
+
+_iso_time = re.compile(r'(.*\d\d:\d\d(?::\d\d)?)(?:(?<=:\d\d:\d\d)[.,](\d+))?(?:([Zz])|([+-]\d\d)(?::?(\d\d))?)?')
+
+
+def _decode_datetime(obj):
+    if isinstance(obj, str):
+        result = _parse_iso(datetime, obj)
+        if result is not None:
+            return result
+        if dateutil_fallback:
+            import dateutil.parser
+            return dateutil.parser.parse(obj)
+        raise HowardError('Invalid value "{value}". Must be an ISO 8601 datetime', obj, datetime)
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        # seconds since the epoch
+        return datetime.fromtimestamp(obj, tz=timezone.utc)
+    raise HowardError('Object "{value}" not of expected type {expected}', obj, datetime)
+
+
+def _decode_date(obj):
+    if isinstance(obj, str):
+        result = _parse_iso(date, obj)
+        if result is not None:
+            return result
+        raise HowardError('Invalid value "{value}". Must be an ISO 8601 date', obj, date)
+    raise HowardError('Object "{value}" not of expected type {expected}', obj, date)
+
+
+def _decode_time(obj):
+    if isinstance(obj, str):
+        result = _parse_iso(time, obj)
+        if result is not None:
+            return result
+        raise HowardError('Invalid value "{value}". Must be an ISO 8601 time', obj, time)
+    raise HowardError('Object "{value}" not of expected type {expected}', obj, time)
+
+
+_iso_duration = re.compile(
+    r'([-+])?P(?:(\d+(?:\.\d+)?)W)?(?:(\d+(?:\.\d+)?)D)?'
+    r'(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?'
+)
+
+
+def _decode_timedelta(obj):
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        return timedelta(seconds=obj)
+    if isinstance(obj, str):
+        match = _iso_duration.fullmatch(obj)
+        if match and obj.rstrip('T')[-1] not in 'P':
+            sign, weeks, days, hours, minutes, seconds = match.groups()
+            result = timedelta(
+                weeks=float(weeks or 0), days=float(days or 0), hours=float(hours or 0),
+                minutes=float(minutes or 0), seconds=float(seconds or 0),
+            )
+            return -result if sign == '-' else result
+        raise HowardError('Invalid value "{value}". Must be an ISO 8601 duration', obj, timedelta)
+    raise HowardError('Object "{value}" not of expected type {expected}', obj, timedelta)
+
+
+def _build_dataclass_decoder(t, options):
+    _type_hints(t, strict=True)
+    lazy = _lazy_fields(t, options)
+    if t in _compiled and options.compiled and not lazy and not options.profile and not options.all_errors:
+        _compile_fields(t)
+        return _build_compiled_decoder(t, options)
+    plan = []
+    names = frozenset(f.name for f in dataclasses.fields(t))
+    cls = _lazy_class(t, lazy) if lazy else t
+    construction = _construction(t)
+
+    def check_extras(obj):
+        extras = set(obj.keys()) - names
+        if extras:
+            raise HowardError('Found unexpected keys {value} when converting to {expected}', extras, t)
+
+    if construction == 'positional':
+        def decode_dataclass(obj):
+            args = []
+            try:
+                for name, decoder, default in plan:
+                    if name in obj:
+                        args.append(decoder(obj[name]))
+                    elif default is None:
+                        raise _missing_key(obj)
+                    else:
+                        args.append(default())
+            except HowardError as e:
+                raise e._at(name)
+            if not options.ignore_extras:
+                check_extras(obj)
+            return cls(*args)
+    elif construction == 'dict':
+        post_init = getattr(cls, '__post_init__', None)
+        late = [(f.name, _default(f)) for f in dataclasses.fields(t) if not f.init and _default(f)]
+
+        def decode_dataclass(obj):
+            values = {}
+            try:
+                for name, decoder, default in plan:
+                    if name in obj:
+                        values[name] = decoder(obj[name])
+                    elif default is None:
+                        raise _missing_key(obj)
+                    else:
+                        values[name] = default()
+            except HowardError as e:
+                raise e._at(name)
+            for name, default in late:
+                values[name] = default()
+            if not options.ignore_extras:
+                check_extras(obj)
+            instance = object.__new__(cls)
+            instance.__dict__.update(values)
+            if post_init is not None:
+                post_init(instance)
+            return instance
+    else:
+        def decode_dataclass(obj):
+            kwargs = {}
+            try:
+                for name, decoder, default in plan:
+                    if name in obj:
+                        kwargs[name] = decoder(obj[name])
+            except HowardError as e:
+                raise e._at(name)
+            if not options.ignore_extras:
+                check_extras(obj)
+            return cls(**kwargs)
+
+    if options.all_errors:
+        def find_errors(obj):
+            errors = _item_errors((name, decoder, obj[name]) for name, decoder, _ in plan if name in obj)
+            for name, _, default in plan:
+                if default is None and name not in obj:
+                    errors.append(_missing_key(obj)._at(name))
+            if not options.ignore_extras and not names.issuperset(obj.keys()):
+                errors.append(HowardError('Found unexpected keys {value} when converting to {expected}',
+                                          set(obj.keys()) - names, t))
+            return errors
+        decode_dataclass = _collect_errors(decode_dataclass, find_errors)
+    if options.profile:
+        decode_dataclass = _profiled('decode', t, None, decode_dataclass)
+
+    types = _type_hints(t)
+    for f in dataclasses.fields(t):
+        if not f.init and construction != 'kwargs':
+            continue
+        decoder = _field_decoder(f, types[f.name], options) or _get_decoder(types[f.name], options)
+        if f.name in lazy:
+            decoder = functools.partial(_Pending, decoder=decoder)
+        elif options.profile:
+            decoder = _profiled('decode', t, f.name, decoder)
+        plan.append((f.name, decoder, _default(f)))
+    return decode_dataclass
+
+
+def _construction(t):
+    """
+    The cheapest way to create instances of the dataclass t from decoded
+    values, that still has the semantics of its __init__:
+
+    * 'positional' calls t(*args), which skips building a kwargs dict
+    * 'dict' fills the __dict__ of a new instance directly and calls
+      __post_init__, which avoids the slow attribute setting of frozen classes
+    * 'kwargs' calls t(**kwargs), for custom __init__ methods, InitVars and
+      keyword only fields
+    """
+    code = getattr(t.__init__, '__code__', None)
+    params = len([f for f in dataclasses.fields(t) if f.init])
+    if (code is None or code.co_filename != '<string>'  # not generated by dataclasses
+            or code.co_kwonlyargcount or code.co_argcount != params + 1):
+        return 'kwargs'
+    if t.__dataclass_params__.frozen and t.__dictoffset__:
+        return 'dict'
+    return 'positional'
+
+
+def _default(f):
+    """ A callable returning the default of a dataclass field, or None if it has none """
+    if f.default is not dataclasses.MISSING:
+        return functools.partial(_decode_any, f.default)
+    if f.default_factory is not dataclasses.MISSING:
+        return f.default_factory
+    return None
+
+
+def _lazy_fields(t, options):
+    """ Names of the fields of the dataclass t that should be decoded on first access """
+    if not t.__dictoffset__:
+        return ()  # slotted instances have nowhere to keep the pending values
+    types = _type_hints(t)
+    return tuple(
+        f.name for f in dataclasses.fields(t)
+        if f.metadata.get('howard', {}).get('lazy', options.lazy and _is_nested(types[f.name]))
+    )
+
+
+def _is_nested(t):
+    """ Whether t is a dataclass, list or dict type, optionally wrapped in Optional """
+    t = _unwrap_newtype(_optional_arg(t) or t)
+    return (dataclasses.is_dataclass(t) or t in (list, dict)
+            or typing.get_origin(t) in (list, dict))
+
+
+class _Pending:
+    """ A raw value waiting to be decoded, stored in place of a lazy field """
+    __slots__ = ('value', 'decoder')
+
+    def __init__(self, value, decoder):
+        self.value = value
+        self.decoder = decoder
+
+
+class _LazyField:
+    """ Decodes the pending value of a lazy field on first access, and keeps the result """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return getattr(cls.__mro__[1], self.name)
+        d = obj.__dict__
+        try:
+            value = d[self.name]
+        except KeyError:
+            raise AttributeError(self.name) from None
+        if value.__class__ is _Pending:
+            try:
+                value = d[self.name] = value.decoder(value.value)
+            except HowardError as e:
+                raise e._at(self.name)
+        return value
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = value
+
+
+# Subclasses of dataclasses with lazy fields, keyed by (dataclass, lazy fields)
+_lazy_classes = {}
+
+
+def _lazy_class(t, names):
+    try:
+        return _lazy_classes[t, names]
+    except KeyError:
+        pass
+
+    ns = {name: _LazyField(name) for name in names}
+    ns.update(
+        __module__=t.__module__,
+        __qualname__=t.__qualname__,
+        __reduce_ex__=lambda self, protocol: (_restore_lazy, (t, dict(_lazy_items(self)))),
+    )
+    if t.__dataclass_params__.eq:
+        # the dataclass __eq__ only compares instances of the exact same class
+        compared = [f.name for f in dataclasses.fields(t) if f.compare]
+
+        def __eq__(self, other):
+            if other.__class__ is self.__class__ or other.__class__ is t:
+                return (tuple(getattr(self, n) for n in compared)
+                        == tuple(getattr(other, n) for n in compared))
+            return NotImplemented
+        ns.update(__eq__=__eq__, __hash__=t.__hash__)
+
+    cls = _lazy_classes[t, names] = type(t.__name__, (t,), ns)
+    return cls
+
+
+def _lazy_items(obj):
+    for name in list(obj.__dict__):
+        yield name, getattr(obj, name)
+
+
+def _restore_lazy(t, state):
+    # lazy instances are copied and pickled as instances of the plain dataclass
+    obj = object.__new__(t)
+    obj.__dict__.update(state)
+    return obj
+
+
+def _field_decoder(f, field_type, options):
+    """ The decoder for a dataclass field set up through its metadata, if any """
+    settings = f.metadata.get('howard', {})
+    if settings.get('decoder'):
+        return settings['decoder']
+    if settings.get('discriminator'):
+        return _get_decoder(field_type, options, settings['discriminator'])
+    return None
+
+
+def _build_union_decoder(args, options, discriminator=None):
+    optional = type(None) in args
+    members = []
+    # members are tried one after the other, collecting every error of the ones
+    # that dont match would be wasted work
+    probe_options = options._replace(all_errors=False)
+    for arg in args:
+        decoder = _get_decoder(arg, probe_options)
+        if dataclasses.is_dataclass(arg):
+            # key set fingerprint, used to skip dataclasses that cant match
+            fields = dataclasses.fields(arg)
+            required = frozenset(f.name for f in fields if _is_required(f))
+            names = None if options.ignore_extras else frozenset(f.name for f in fields)
+            members.append((arg, decoder, required, names))
+        else:
+            members.append((arg, decoder, None, None))
+    if optional and len(members) == 2 and not options.validate:
+        # trusted to be the other member when it isnt None, like in compiled decoders
+        decode_member = next(decoder for arg, decoder, _, _ in members if arg is not type(None))
+
+        def decode_trusted_optional(obj):
+            return None if obj is None else decode_member(obj)
+        return decode_trusted_optional
+    tag_field, tags = _union_tags(args, options, discriminator)
+
+    # members worth trying, by the class of the value being decoded
+    candidates = {}
+
+    def get_candidates(cls):
+        try:
+            return candidates[cls]
+        except KeyError:
+            found = candidates[cls] = [
+                (decoder, required, names)
+                for arg, decoder, required, names in members
+                if _accepts(arg, cls)
+            ]
+            return found
+
+    def decode_union(obj):
+        if optional and obj is None:
+            # an `Optional[x]` type or `Union[x, y, None]` type
+            return obj
+        if tag_field is not None and isinstance(obj, dict):
+            try:
+                decoder = tags.get(obj.get(tag_field))
+            except TypeError:  # unhashable tag value
+                decoder = None
+            if decoder is not None:
+                return decoder(obj)
+        error = None
+        for decoder, required, names in get_candidates(obj.__class__):
+            if required is not None:
+                if not required <= obj.keys():
+                    continue
+                if names is not None and not obj.keys() <= names:
+                    continue
+            try:
+                return decoder(obj)
+            except HowardError as e:
+                # the error of the only member that was tried says more than the generic one
+                error = e if error is None else False
+        if error:
+            raise error
+        raise HowardError('{value} could not be converted to any type in: {expected}', obj, args)
+    return decode_union
+
+
+# Resolved annotations of dataclasses and TypedDicts, keyed by type
+_hints = {}
+
+
+def _type_hints(t, strict=False):
+    """
+    The annotations of a dataclass or TypedDict with string annotations and
+    forward references resolved. Dataclass fields are returned in field order.
+    Annotations referring to classes that dont exist (yet) are returned as is,
+    or with strict=True, raise.
+    """
+    try:
+        return _hints[t]
+    except KeyError:
+        pass
+    try:
+        # the class itself is added so self references resolve even when it
+        # isnt reachable from its module, i.e. it was defined in a function
+        hints = typing.get_type_hints(t, localns={t.__name__: t})
+    except NameError as e:
+        if strict:
+            raise HowardError(f'Cant resolve the annotations of {t}: {e}') from None
+        # not cached, the classes they refer to may be defined later on
+        hints = dict(getattr(t, '__annotations__', {}))
+        if dataclasses.is_dataclass(t):
+            hints = {f.name: hints.get(f.name, f.type) for f in dataclasses.fields(t)}
+        return hints
+    except TypeError:
+        hints = dict(getattr(t, '__annotations__', {}))
+    if dataclasses.is_dataclass(t):
+        hints = {f.name: hints.get(f.name, f.type) for f in dataclasses.fields(t)}
+    _hints[t] = hints
+    return hints
+
+
+def _is_required(f):
+    return (f.init and f.default is dataclasses.MISSING
+            and f.default_factory is dataclasses.MISSING)
+
+
+def _union_tags(args, options, discriminator):
+    """
+    Find the field that tells the dataclasses in a union apart, either the
+    configured discriminator, or a `Literal` field all of them have. Returns
+    the field name and a mapping of its values to decoders.
+    """
+    members = [a for a in args if dataclasses.is_dataclass(a)]
+    if discriminator is None:
+        if len(members) < 2:
+            return None, None
+        types = _type_hints(members[0])
+        candidates = [
+            name for name, field_type in types.items()
+            if typing.get_origin(field_type) is typing.Literal
+        ]
+    else:
+        candidates = [discriminator]
+
+    for name in candidates:
+        tags = {}
+        for member in members:
+            f = next((f for f in dataclasses.fields(member) if f.name == name), None)
+            field_type = _type_hints(member).get(name)
+            if f is None:
+                values = ()
+            elif typing.get_origin(field_type) is typing.Literal:
+                values = typing.get_args(field_type)
+            elif discriminator is not None and f.default is not dataclasses.MISSING:
+                values = (f.default,)
+            else:
+                values = ()
+            if not values or any(v in tags for v in values):
+                break  # missing or ambiguous, cant discriminate on this field
+            decoder = _get_decoder(member, options)
+            tags.update((v, decoder) for v in values)
+        else:
+            return name, tags
+
+    if discriminator is not None:
+        raise HowardError(
+            f'Discriminator "{discriminator}" must be a Literal field or a field with '
+            f'a distinct default in every dataclass of: {", ".join(f"{a}" for a in args)}'
+        )
+    return None, None
+
+
+def _accepts(t, cls):
+    """
+    Whether the decoder for t could accept a value of class cls. This is used
+    by unions to skip members that would certainly fail.
+    """
+    t = _unwrap_newtype(t)
+    origin = typing.get_origin(t)
+    if t == typing.Any:
+        return True
+    elif t is type(None):
+        return cls is type(None)
+    elif dataclasses.is_dataclass(t) or isinstance(t, typing._TypedDictMeta) or t == dict:
+        return issubclass(cls, dict)
+    elif t == list:
+        return issubclass(cls, list)
+    elif origin is Union:
+        return any(_accepts(a, cls) for a in typing.get_args(t))
+    elif origin is typing.Literal:
+        return any(issubclass(cls, type(a)) or issubclass(type(a), cls) for a in typing.get_args(t))
+    elif origin is not None:
+        return issubclass(cls, origin)
+    elif _registered_converter(_type_decoders, t)[1] is not None:
+        return True  # registered decoders could accept anything
+    elif isinstance(t, EnumMeta):
+        if getattr(t._missing_, '__func__', None) is not Enum._missing_.__func__:
+            return True  # custom lookup, could accept anything
+        return issubclass(cls, t) or any(issubclass(cls, type(m.value)) for m in t)
+    elif t in (int, str, bool, float):
+        return issubclass(cls, t)
+    elif t in (datetime, timedelta):
+        return issubclass(cls, (str, int, float)) and not issubclass(cls, bool)
+    elif t in (date, time):
+        return issubclass(cls, str)
+    bases = [p for p in getattr(t, '__bases__', ()) if p is not object]
+    return any(_accepts(p, cls) for p in bases) if bases else True
+
+
+def _build_typed_dict_decoder(t, options):
+    hints = _type_hints(t, strict=True)
+    plan = [(k, _get_decoder(v, options)) for k, v in hints.items()]
+    required = getattr(t, '__required_keys__', hints.keys() if t.__total__ else ())
+
+    def decode_typed_dict(obj):
+        result = {}
+        try:
+            for key, decoder in plan:
+                if key not in obj:
+                    if key in required:
+                        raise _missing_key(obj)
+                else:
+                    result[key] = decoder(obj[key])
+        except HowardError as e:
+            raise e._at(key)
+        if not options.ignore_extras:
+            for key in obj:
+                if key not in hints:
+                    raise HowardError('Found unexpected key {value} when converting to {expected}', key, t)
+        return result
+
+    if options.all_errors:
+        def find_errors(obj):
+            errors = _item_errors((key, decoder, obj[key]) for key, decoder in plan if key in obj)
+            for key in required:
+                if key not in obj:
+                    errors.append(_missing_key(obj)._at(key))
+            if not options.ignore_extras:
+                errors += [HowardError('Found unexpected key {value} when converting to {expected}', key, t)
+                           for key in obj if key not in hints]
+            return errors
+        return _collect_errors(decode_typed_dict, find_errors)
+    return decode_typed_dict
+
+
+def _build_registered_decoder(t):
+    cls, decode = _registered_converter(_type_decoders, t)
+    if cls is t:
+        return decode
+
+    def decode_subclass(obj):
+        value = decode(obj)
+        return value if isinstance(value, t) else t(value)
+    return decode_subclass
+
+
+def _build_subclass_decoder(t, options):
+    # not supported type, attempt to use parent classes
+    decoders = [
+        _get_decoder(p, options)
+        for p in getattr(t, '__bases__', ())
+        if p != object
+    ]
+
+    def decode_subclass(obj):
+        for decoder in decoders:
+            try:
+                return t(decoder(obj))
+            except TypeError:
+                continue
+        raise HowardError('Unsupported type {expected}', obj, t)
+    return decode_subclass
+
+
+def _convert_from(obj, options):
+    try:
+        encoder = _encoders[type(obj), options]
+    except KeyError:
+        encoder = _get_encoder(type(obj), options)
+    return encoder(obj)
+
+
+# Encoder plans, keyed by (class of the value, encode options). Unlike decoding, the
+# encoder is picked from the runtime class of each value, not the annotation.
+_encoders = {}
+
+
+def _get_encoder(cls, options):
+    encoder = _build_encoder(cls, options)
+    _encoders[cls, options] = encoder
+    return encoder
+
+
+def _build_encoder(cls, options):
+    if dataclasses.is_dataclass(cls):
+        encoder = _build_dataclass_encoder(cls, options)
+        if _is_recursive(cls):
+            return _walk_when_deep(encoder, _encode_root(cls, options))
+        return encoder
+    elif _registered_converter(_type_encoders, cls)[1] is not None:
+        return _registered_converter(_type_encoders, cls)[1]
+    elif issubclass(cls, list):
+        def encode_list(obj):
+            if _plain_values.issuperset(map(type, obj)):
+                # nothing to convert, skip the per item calls
+                return list(obj) if options.copy else obj
+            items = iter(obj)
+            try:
+                return [_convert_from(i, options) for i in items]
+            except HowardError as e:
+                raise e._at(_failed_index(obj, items))
+        return encode_list
+    elif issubclass(cls, dict):
+        def encode_dict(obj):
+            if _plain_values.issuperset(map(type, obj.values())):
+                return dict(obj) if options.copy else obj
+            items = iter(obj.items())
+            try:
+                return {k: _convert_from(v, options) for k, v in items}
+            except HowardError as e:
+                raise e._at(_failed_key(obj, items))
+        return encode_dict
+    elif isinstance(cls, EnumMeta):
+        return lambda obj: _convert_from(obj.value, options)
+    elif cls in (int, str, bool, float, type(None)):
+        return _encode_identity
+    elif cls in (datetime, date, time):
+        return cls.isoformat
+    elif cls is timedelta:
+        return timedelta.total_seconds
+    else:
+        def encode_unsupported(obj):
+            raise HowardError('Unsupported type {value}', cls)
+        return encode_unsupported
+
+
+def _encode_identity(obj):
+    return obj
+
+
+# classes of values that are encoded as themselves
+_plain_values = frozenset([int, str, bool, float, type(None)])
+
+
+class _EncodeOptions(typing.NamedTuple):
+    """ Settings that change how encoder plans are built """
+    public: bool = False
+    copy: bool = True
+    profile: bool = False
+
+
+def _build_dataclass_encoder(cls, options):
+    if cls in _compiled and not options.profile:
+        _compile_fields(cls)
+        return _build_compiled_encoder(cls, options)
+    plan = []
+    for f in dataclasses.fields(cls):
+        if f.name.startswith('_') and options.public:
+            continue  # these attributes dont make it into the dict
+        if f.metadata.get('internal', False):
+            continue  # these attributes are marked as internal
+        encoder = f.metadata.get('howard', {}).get('encoder')
+        if options.profile:
+            encoder = _profiled('encode', cls, f.name,
+                                encoder or functools.partial(_convert_from, options=options))
+        plan.append((f.name, encoder))
+
+    def encode_dataclass(obj):
+        d = {}
+        for name, encoder in plan:
+            # read outside the try, lazy fields add their name to their errors themselves
+            value = getattr(obj, name)
+            try:
+                if encoder:
+                    d[name] = encoder(value)
+                else:
+                    d[name] = _convert_from(value, options)
+            except HowardError as e:
+                raise e._at(name)
+        return d
+    if options.profile:
+        return _profiled('encode', cls, None, encode_dataclass)
+    return encode_dataclass
+
+
+# Self-referencing dataclasses can nest arbitrarily deep. Their plans are used as usual,
+# but once those run out of stack the conversion is done again by _walk, which keeps
+# its own stack of nodes instead of recursing. A node is either
+# (_LEAF, fn) for values converted in a single call, (_OPTIONAL, node) for None or
+# node, or (_NESTED, expand, finish). expand(value) converts the leaf children right
+# away and returns (results, pending), pending being the (slot, segment, node, value)
+# children still to be walked, segment being their key in the path of errors.
+# finish(value, results) builds the value once they are all done.
+_LEAF, _OPTIONAL, _NESTED = range(3)
+
+
+def _walk(node, value):
+    results, pending = node[1](value)
+    stack = [(node[2], value, results, iter(pending), None, None)]
+    try:
+        while True:
+            finish, value, results, pending, slot, _ = stack[-1]
+            for child_slot, segment, node, child in pending:
+                try:
+                    child_results, child_pending = node[1](child)
+                    if not child_pending:
+                        # nothing nested, no need to go through the stack
+                        results[child_slot] = node[2](child, child_results)
+                        continue
+                except HowardError as e:
+                    raise e._at(segment)
+                stack.append((node[2], child, child_results, iter(child_pending), child_slot, segment))
+                break
+            else:
+                result = finish(value, results)
+                stack.pop()
+                if not stack:
+                    return result
+                stack[-1][2][slot] = result
+    except HowardError as e:
+        # the segments of the values being walked, innermost first
+        for frame in reversed(stack[1:]):
+            e._at(frame[5])
+        raise
+
+
+def _is_recursive(t):
+    """ Whether t can contain another instance of t """
+    found = set()
+    for field_type in _type_hints(t).values():
+        _collect_dataclasses(field_type, found)
+    return t in found
+
+
+def _walk_when_deep(convert, root):
+    def convert_deep(obj):
+        try:
+            return convert(obj)
+        except RecursionError as e:
+            if _frames(e.__traceback__) < _walk_headroom:
+                raise  # too little stack left to walk, done by one further out instead
+        try:
+            return _walk(root, obj)
+        except HowardError as e:
+            # only the first error is reported for values this deep, see _collect_errors
+            e._walked = True
+            raise
+    return convert_deep
+
+
+# Stack frames a conversion needs left for walking its value, instead of leaving it
+# to the conversion of a value further out
+_walk_headroom = 100
+
+
+def _frames(tb):
+    """ The number of frames in the traceback tb """
+    count = 0
+    while tb is not None:
+        count += 1
+        tb = tb.tb_next
+    return count
+
+
+def _decode_node(t, options, nodes):
+    t = _unwrap_newtype(t)
+    try:
+        return nodes[t]
+    except (KeyError, TypeError):
+        pass
+    if dataclasses.is_dataclass(t) and not _lazy_fields(t, options) and _is_recursive(t):
+        return _decode_dataclass_node(t, options, nodes)
+    origin, args = typing.get_origin(t), typing.get_args(t)
+    inner = _optional_arg(t)
+    if inner is not None:
+        node = _decode_node(inner, options, nodes)
+        if node[0] is not _LEAF:
+            return (_OPTIONAL, node)
+    elif origin is list:
+        item = _decode_node(args[0], options, nodes)
+        if item[0] is not _LEAF:
+            def expand_list(obj):
+                if options.validate and not isinstance(obj, list):
+                    raise HowardError('Object "{value}" not of expected type {expected}', obj, origin)
+                results = [None] * len(obj)
+                return results, _pending_items(item, ((i, i, v) for i, v in enumerate(obj)))
+            return (_NESTED, expand_list, _finish_list)
+    elif origin is dict:
+        value = _decode_node(args[1], options, nodes)
+        if value[0] is not _LEAF:
+            decode_key = _get_decoder(args[0], options)
+
+            def expand_dict(obj):
+                if options.validate and not isinstance(obj, dict):
+                    raise HowardError('Object "{value}" not of expected type {expected}', obj, origin)
+                results = [None] * len(obj)
+                return results, _pending_items(value, ((i, k, v) for i, (k, v) in enumerate(obj.items())))
+
+            def finish_dict(obj, results):
+                items = iter(zip(obj, results))
+                try:
+                    return {decode_key(k): v for k, v in items}
+                except HowardError as e:
+                    raise e._at(_failed_key(obj, items))
+            return (_NESTED, expand_dict, finish_dict)
+    return (_LEAF, _get_decoder(t, options))
+
+
+def _pending_items(node, items):
+    """ The pending children of a container whose items all use node """
+    if node[0] is _NESTED:
+        return [(i, segment, node, v) for i, segment, v in items]
+    # optional items, only the ones that arent None are walked
+    node = node[1]
+    return [(i, segment, node, v) for i, segment, v in items if v is not None]
+
+
+def _finish_list(obj, results):
+    return results
+
+
+def _decode_dataclass_node(t, options, nodes):
+    plan = []
+    names = frozenset(f.name for f in dataclasses.fields(t))
+    construction = _construction(t)
+
+    def expand_dataclass(obj):
+        results = []
+        pending = []
+        try:
+            for name, kind, node, default in plan:
+                if name in obj:
+                    value = obj[name]
+                    if kind is _LEAF:
+                        value = node(value)
+                    elif kind is _NESTED or value is not None:
+                        pending.append((len(results), name, node, value))
+                elif default is None:
+                    raise _missing_key(obj)
+                elif construction != 'kwargs':
+                    value = default()
+                else:
+                    continue
+                results.append(value)
+        except HowardError as e:
+            raise e._at(name)
+        if not options.ignore_extras:
+            extras = set(obj.keys()) - names
+            if extras:
+                raise HowardError('Found unexpected keys {value} when converting to {expected}', extras, t)
+        return results, pending
+
+    if construction == 'positional':
+        def finish_dataclass(obj, results):
+            return t(*results)
+    elif construction == 'dict':
+        post_init = getattr(t, '__post_init__', None)
+        late = [(f.name, _default(f)) for f in dataclasses.fields(t) if not f.init and _default(f)]
+
+        def finish_dataclass(obj, results):
+            values = dict(zip([name for name, _, _, _ in plan], results))
+            for name, default in late:
+                values[name] = default()
+            instance = object.__new__(t)
+            instance.__dict__.update(values)
+            if post_init is not None:
+                post_init(instance)
+            return instance
+    else:
+        def finish_dataclass(obj, results):
+            return t(**dict(zip([name for name, _, _, _ in plan if name in obj], results)))
+
+    # registered before the fields, which refer back to it
+    node = nodes[t] = (_NESTED, expand_dataclass, finish_dataclass)
+    types = _type_hints(t)
+    for f in dataclasses.fields(t):
+        if not f.init and construction != 'kwargs':
+            continue
+        decoder = _field_decoder(f, types[f.name], options)
+        field_node = (_LEAF, decoder) if decoder else _decode_node(types[f.name], options, nodes)
+        kind = field_node[0]
+        # stored unwrapped, a leaf as its function and an optional as its inner node
+        plan.append((f.name, kind, field_node if kind is _NESTED else field_node[1], _default(f)))
+    return node
+
+
+def _encode_root(cls, options):
+    nodes = {}
+    # lists and dicts are only walked when they hold values that need converting,
+    # keyed by class: (get the values, leaf node, nested node)
+    containers = {}
+
+    def node_for(value):
+        vcls = value.__class__
+        node = nodes.get(vcls)
+        if node is not None:
+            return node
+        try:
+            values, leaf, nested = containers[vcls]
+        except KeyError:
+            add_node(vcls)
+            return node_for(value)
+        if _plain_values.issuperset(map(type, values(value))):
+            return leaf
+        return nested
+
+    def add_node(vcls):
+        if dataclasses.is_dataclass(vcls) and _is_recursive(vcls):
+            nodes[vcls] = _encode_dataclass_node(vcls, options, node_for)
+            return
+        try:
+            leaf = (_LEAF, _encoders[vcls, options])
+        except KeyError:
+            leaf = (_LEAF, _get_encoder(vcls, options))
+        if _registered_converter(_type_encoders, vcls)[1] is not None:
+            nodes[vcls] = leaf
+        elif issubclass(vcls, list):
+            containers[vcls] = (_encode_identity, leaf, (_NESTED, expand_list, _finish_list))
+        elif issubclass(vcls, dict):
+            containers[vcls] = (dict.values, leaf, (_NESTED, expand_dict, finish_dict))
+        else:
+            nodes[vcls] = leaf
+
+    def expand_values(items):
+        results = []
+        pending = []
+        try:
+            for segment, value in items:
+                if value.__class__ in _plain_values:
+                    results.append(value)
+                    continue
+                node = node_for(value)
+                if node[0] is _LEAF:
+                    value = node[1](value)
+                else:
+                    pending.append((len(results), segment, node, value))
+                results.append(value)
+        except HowardError as e:
+            raise e._at(segment)
+        return results, pending
+
+    def expand_list(obj):
+        return expand_values(enumerate(obj))
+
+    def expand_dict(obj):
+        return expand_values(obj.items())
+
+    def finish_dict(obj, results):
+        return dict(zip(obj, results))
+
+    root = nodes[cls] = _encode_dataclass_node(cls, options, node_for)
+    return root
+
+
+def _encode_dataclass_node(cls, options, node_for):
+    plan = []
+    for f in dataclasses.fields(cls):
+        if f.name.startswith('_') and options.public:
+            continue
+        if f.metadata.get('internal', False):
+            continue
+        plan.append((f.name, f.metadata.get('howard', {}).get('encoder')))
+    names = [name for name, _ in plan]
+
+    def expand_dataclass(obj):
+        results = []
+        pending = []
+        for name, encoder in plan:
+            value = getattr(obj, name)  # outside the try, see _build_dataclass_encoder
+            try:
+                if encoder:
+                    value = encoder(value)
+                elif value.__class__ not in _plain_values:
+                    node = node_for(value)
+                    if node[0] is _LEAF:
+                        value = node[1](value)
+                    else:
+                        pending.append((len(results), name, node, value))
+            except HowardError as e:
+                raise e._at(name)
+            results.append(value)
+        return results, pending
+
+    def finish_dataclass(obj, results):
+        return dict(zip(names, results))
+    return (_NESTED, expand_dataclass, finish_dataclass)
+
+
+# Dataclasses that have opted into generated converters through `compile`.
+_compiled = set()
+
+
+def _compile_fields(t):
+    """ Compile the dataclasses the compiled dataclass t refers to, that werent defined yet when it was """
+    for field_type in _type_hints(t).values():
+        _collect_dataclasses(field_type, _compiled)
+
+
+def _collect_dataclasses(t, found):
+    """ Add t and every dataclass reachable through its annotations to found """
+    if dataclasses.is_dataclass(t):
+        if t in found:
+            return
+        found.add(t)
+        for field_type in _type_hints(t).values():
+            _collect_dataclasses(field_type, found)
+    else:
+        for arg in typing.get_args(t):
+            _collect_dataclasses(arg, found)
+
+
+class _CodeBuilder:
+    """ Keeps track of the objects referenced by generated source """
+
+    def __init__(self):
+        self.namespace = {'HowardError': HowardError, '_convert_from': _convert_from}
+        self._names = {}
+
+    def ref(self, obj):
+        try:
+            return self._names[id(obj)]
+        except KeyError:
+            name = f'_r{len(self._names)}'
+            self._names[id(obj)] = name
+            self.namespace[name] = obj
+            return name
+
+    def create_fn(self, name, args, body):
+        body = '\n'.join(f'    {line}' for line in body)
+        source = f'def {name}({args}):\n{body}'
+        exec(_compile_source(source) if cache_dir else source, self.namespace)
+        return self.namespace[name]
+
+
+def _compile_source(source):
+    """ Compile generated source, going through the bytecode kept in cache_dir """
+    import hashlib
+    import importlib.util
+
+    key = hashlib.sha1(importlib.util.MAGIC_NUMBER + source.encode()).hexdigest()
+    path = os.path.join(cache_dir, f'{key}.bin')
+    try:
+        with open(path, 'rb') as f:
+            code = marshal.load(f)
+        if isinstance(code, CodeType):
+            return code
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    code = builtins.compile(source, '<string>', 'exec')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # written aside first, processes starting together may read it already
+        tmp = f'{path}.{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            marshal.dump(code, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # only a cache
+    return code
+
+
+def _unwrap_newtype(t):
+    while hasattr(t, '__supertype__'):
+        t = t.__supertype__
+    return t
+
+
+def _optional_arg(t):
+    """ The x in `Optional[x]`, or None if t is not an optional type """
+    if typing.get_origin(t) is Union:
+        args = [a for a in typing.get_args(t) if a is not type(None)]
+        if len(args) == 1 and len(args) != len(typing.get_args(t)):
+            return args[0]
+    return None
+
+
+def _decode_expr(b, t, var, options, depth=0):
+    """
+    Build a python expression decoding `var` into type t. Values with the
+    exact expected shape are handled inline, anything else falls back to the
+    decoder plan for t, which does the full validation.
+    """
+    t = _unwrap_newtype(t)
+    if t == typing.Any:
+        return var
+    fallback = f'{b.ref(_get_decoder(t, options))}({var})'
+
+    if t in (int, str, bool, float):
+        if not options.validate:
+            return var
+        return f'({var} if type({var}) is {t.__name__} else {fallback})'
+
+    optional = _optional_arg(t)
+    if optional is not None:
+        inner = _decode_expr(b, optional, var, options, depth)
+        return f'(None if {var} is None else {inner})'
+
+    origin, args = typing.get_origin(t), typing.get_args(t)
+    if (t in (list, dict) or origin in (list, dict)) and all(_plain_classes(a) is not None for a in args):
+        return fallback  # the decoder skips plain containers in one go
+    if t == list or origin is list:
+        item = f'i{depth}'
+        inner = _decode_expr(b, args[0] if args else typing.Any, item, options, depth + 1)
+        return f'([{inner} for {item} in {var}] if type({var}) is list else {fallback})'
+    if t == dict or origin is dict:
+        key, item = f'k{depth}', f'i{depth}'
+        key_type, value_type = args if args else (typing.Any, typing.Any)
+        key_expr = _decode_expr(b, key_type, key, options, depth + 1)
+        value_expr = _decode_expr(b, value_type, item, options, depth + 1)
+        return (f'({{{key_expr}: {value_expr} for {key}, {item} in {var}.items()}} '
+                f'if type({var}) is dict else {fallback})')
+    return fallback
+
+
+def _build_compiled_decoder(t, options):
+    b = _CodeBuilder()
+    construction = _construction(t)
+    body = ['kwargs = {}'] if construction == 'kwargs' else []
+    values = []
+    types = _type_hints(t)
+    # on errors, fields without a custom decoder are decoded again by the plain plans
+    replay = options._replace(compiled=False)
+    for i, f in enumerate(dataclasses.fields(t)):
+        decoder = _field_decoder(f, types[f.name], options)
+        if decoder:
+            expr = f'{b.ref(decoder)}(v)'
+        else:
+            expr = _decode_expr(b, types[f.name], 'v', options)
+        locate = (f'except HowardError as e:',
+                  f'    raise {b.ref(_locate)}(e, obj, {f.name!r}, v, '
+                  f'{b.ref(types[f.name])}, {b.ref(None if decoder else replay)})')
+
+        if construction == 'kwargs':
+            body += [
+                f'if {f.name!r} in obj:',
+                f'    v = obj[{f.name!r}]',
+                '    try:',
+                f'        kwargs[{f.name!r}] = {expr}',
+                *[f'    {line}' for line in locate],
+            ]
+            continue
+        # locals are numbered so field names cant shadow anything
+        if f.default is not dataclasses.MISSING:
+            default = f'f{i} = {b.ref(f.default)}'
+        elif f.default_factory is not dataclasses.MISSING:
+            default = f'f{i} = {b.ref(f.default_factory)}()'
+        elif f.init:
+            default = f'raise {b.ref(_mark)}({b.ref(_missing_key)}(obj)._at({f.name!r}), obj)'
+        else:
+            continue
+        if f.init:
+            body += [
+                f'if {f.name!r} in obj:',
+                f'    v = obj[{f.name!r}]',
+                '    try:',
+                f'        f{i} = {expr}',
+                *[f'    {line}' for line in locate],
+                'else:',
+                f'    {default}',
+            ]
+        elif construction == 'dict':
+            body.append(default)
+        else:
+            continue
+        values.append((f.name, f'f{i}'))
+
+    if not options.ignore_extras:
+        names = b.ref(frozenset(f.name for f in dataclasses.fields(t)))
+        body += [
+            f'if not {names}.issuperset(obj.keys()):',
+            f'    raise {b.ref(_mark)}(HowardError("Found unexpected keys {{value}} when converting to '
+            f'{{expected}}", set(obj.keys()) - {names}, {b.ref(t)}), obj)',
+        ]
+
+    if construction == 'kwargs':
+        body.append(f'return {b.ref(t)}(**kwargs)')
+    elif construction == 'positional':
+        body.append(f'return {b.ref(t)}({", ".join(local for _, local in values)})')
+    else:
+        body += [
+            f'instance = {b.ref(object.__new__)}({b.ref(t)})',
+            f'instance.__dict__.update({{{", ".join(f"{name!r}: {local}" for name, local in values)}}})',
+        ]
+        if getattr(t, '__post_init__', None) is not None:
+            body.append('instance.__post_init__()')
+        body.append('return instance')
+
+    return b.create_fn(f'decode_{t.__name__}', 'obj', body)
+
+
+def _mark(error, obj):
+    """ Note that the path of error starts at obj """
+    error._source = obj
+    return error
+
+
+def _locate(error, obj, name, value, t, replay):
+    """
+    Give error, raised by compiled code decoding the value of the field name
+    of obj as type t, the path to it from obj. Errors from the compiled
+    decoder of a nested dataclass already know the path from their own input,
+    which is looked up in value. Otherwise, e.g. for items of inline decoded
+    lists, value alone is decoded again by the plans for the replay options.
+    """
+    path = _path_to(t, value, error._source) if error._source is not None else None
+    if path is None:
+        path = ()
+        if replay is not None:
+            try:
+                _get_decoder(t, replay)(value)
+            except HowardError as e:
+                error = e
+    for segment in reversed((name,) + path):
+        error._at(segment)
+    return _mark(error, obj)
+
+
+def _path_to(t, value, target):
+    """ The path to target in value, following the lists and dicts of type t """
+    if value is target:
+        return ()
+    t = _unwrap_newtype(t)
+    t = _optional_arg(t) or t
+    origin = typing.get_origin(t)
+    args = typing.get_args(t)
+    if (t is list or origin is list) and type(value) is list:
+        items = enumerate(value)
+        item_type = args[0] if args else typing.Any
+    elif (t is dict or origin is dict) and type(value) is dict:
+        items = value.items()
+        item_type = args[1] if args else typing.Any
+    else:
+        return None
+    for key, item in items:
+        path = _path_to(item_type, item, target)
+        if path is not None:
+            return (key,) + path
+    return None
+
+
+def _encode_expr(b, t, var, options, depth=0):
+    """
+    Build a python expression encoding `var`, which is expected to be of type
+    t. Values of any other class go through `_convert_from`.
+    """
+    t = _unwrap_newtype(t)
+    fallback = f'_convert_from({var}, {b.ref(options)})'
+
+    if t in (int, str, bool, float):
+        return f'({var} if type({var}) is {t.__name__} else {fallback})'
+    if t is datetime and _registered_converter(_type_encoders, datetime)[1] is None:
+        return f'({var}.isoformat() if type({var}) is {b.ref(datetime)} else {fallback})'
+
+    optional = _optional_arg(t)
+    if optional is not None:
+        inner = _encode_expr(b, optional, var, options, depth)
+        return f'(None if {var} is None else {inner})'
+
+    origin, args = typing.get_origin(t), typing.get_args(t)
+    if args and _plain_classes(args[-1]) is not None:
+        return fallback  # the encoder skips plain containers in one go
+    if origin is list and args:
+        item = f'i{depth}'
+        inner = _encode_expr(b, args[0], item, options, depth + 1)
+        return f'([{inner} for {item} in {var}] if type({var}) is list else {fallback})'
+    if origin is dict and args:
+        key, item = f'k{depth}', f'i{depth}'
+        inner = _encode_expr(b, args[1], item, options, depth + 1)
+        return (f'({{{key}: {inner} for {key}, {item} in {var}.items()}} '
+                f'if type({var}) is dict else {fallback})')
+    return fallback
+
+
+def _build_compiled_encoder(cls, options):
+    b = _CodeBuilder()
+    body = ['d = {}']
+    for f in dataclasses.fields(cls):
+        if f.name.startswith('_') and options.public:
+            continue  # these attributes dont make it into the dict
+        if f.metadata.get('internal', False):
+            continue  # these attributes are marked as internal
+        encoder = f.metadata.get('howard', {}).get('encoder')
+        if encoder:
+            expr = f'{b.ref(encoder)}(v)'
+        else:
+            expr = _encode_expr(b, _type_hints(cls)[f.name], 'v', options)
+        body += [
+            f'v = obj.{f.name}',
+            f'd[{f.name!r}] = {expr}',
+        ]
+    body.append('return d')
+    return b.create_fn(f'encode_{cls.__name__}', 'obj', body)
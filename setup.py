@@ -9,7 +9,7 @@ setup(
     name='howard',
     version='1.12.1',
     packages=['howard'],
-    install_requires=["python-dateutil"],
+    extras_require={'dateutil': ["python-dateutil"]},
     long_description=long_description,
     url='https://github.com/nhumrich/howard',
     long_description_content_type='text/markdown',
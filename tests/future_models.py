@@ -0,0 +1,40 @@
+""" Models using postponed evaluation of annotations, they are all strings """
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import List, Optional, TypedDict
+
+import howard
+
+
+class Address(TypedDict):
+    street: str
+    number: int
+
+
+@dataclass
+class Comment:
+    text: str
+    replies: List[Comment] = field(default_factory=list)
+    parent: Optional[Comment] = None
+
+
+@dataclass
+class Person:
+    name: str
+    age: int
+    address: Address
+
+
+# registered before Player exists, so only prepared once it does
+@howard.model
+@dataclass
+class Team:
+    lead: Player
+    members: List[Player] = field(default_factory=list)
+
+
+@howard.model(compiled=True)
+@dataclass
+class Player:
+    name: str
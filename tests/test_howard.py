@@ -1,6 +1,14 @@
+import asyncio
+from concurrent import futures
+import copy
+import dataclasses
 from dataclasses import dataclass, field
-from datetime import date, datetime
+from datetime import date, datetime, time
 from enum import Enum
+import json
+import pickle
+import sys
+import threading
 
 from typing import List, Dict, Tuple, Optional, Sequence, Union, TypedDict, Literal, NewType, TypeVar, Any
 
@@ -514,3 +522,1497 @@ def test_subclass():
     result = howard.from_dict({'a': 'cabbages'}, SomeType)
     assert isinstance(result, SomeType)
     assert isinstance(result.a, str)
+
+
+def test_decoder_plan_is_cached():
+    howard.from_dict({'hand_id': 2, 'cards': [{'rank': 2, 'suit': 'c'}]}, Hand)
+    decoder = howard._get_decoder(Hand, howard._Options())
+    assert decoder is howard._get_decoder(Hand, howard._Options())
+    assert decoder is not howard._get_decoder(Hand, howard._Options(ignore_extras=False))
+
+
+def test_unsupported_type_not_in_data():
+    @dataclass
+    class MaybeTuple:
+        name: str
+        t: Tuple = ()
+
+    result = howard.from_dict({'name': 'a'}, MaybeTuple)
+    assert result.t == ()
+
+
+def test_encoder_plan_is_cached():
+    obj = Hand(hand_id=1, cards=[Card(rank=2, suit=Suit.club)])
+    assert howard.to_dict(obj) == {'hand_id': 1, 'cards': [{'rank': 2, 'suit': 'c'}]}
+    encoder = howard._encoders[Hand, howard._EncodeOptions()]
+    howard.to_dict(obj)
+    assert howard._encoders[Hand, howard._EncodeOptions()] is encoder
+
+
+def test_public_only_uses_separate_plan():
+    @dataclass
+    class Secret:
+        a: int
+        _b: int
+
+    obj = Secret(a=1, _b=2)
+    assert howard.to_dict(obj, public_only=True) == {'a': 1}
+    assert howard.to_dict(obj) == {'a': 1, '_b': 2}
+
+
+def test_unsupported_type_to_dict():
+    with pytest.raises(TypeError):
+        howard.to_dict(UnsupportedTuple(t=(1, 2)))
+
+
+def test_compile():
+    @dataclass
+    class CompiledCard:
+        rank: int = field(metadata=dict(howard=dict(decoder=validate_rank)))
+        suit: Suit = Suit.heart
+
+    @dataclass
+    class CompiledHand:
+        hand_id: int = 0
+        cards: List[CompiledCard] = field(default_factory=list)
+        tags: Dict[str, List[int]] = field(default_factory=dict)
+        note: Optional[str] = None
+        _secret: str = ''
+
+    assert howard.compile(CompiledHand) is CompiledHand
+
+    d = {'hand_id': 2, 'cards': [{'rank': 2, 'suit': 'c'}], 'tags': {'a': [1, 2]},
+         'note': None, '_secret': 'x'}
+    obj = howard.from_dict(d, CompiledHand)
+    assert obj == CompiledHand(2, [CompiledCard(2, Suit.club)], {'a': [1, 2]}, None, 'x')
+    assert howard.to_dict(obj) == d
+    assert '_secret' not in howard.to_dict(obj, public_only=True)
+
+    with pytest.raises(TypeError):
+        howard.from_dict({'hand_id': 2.5}, CompiledHand)
+    with pytest.raises(TypeError):
+        howard.from_dict({'tags': {'a': ['1']}}, CompiledHand)
+    with pytest.raises(TypeError):
+        howard.from_dict({'hand_id': 1, 'extra': 1}, CompiledHand, ignore_extras=False)
+    with pytest.raises(ValueError):
+        howard.from_dict({'cards': [{'rank': 20, 'suit': 'c'}]}, CompiledHand)
+
+
+def test_compile_keeps_coercion():
+    @dataclass
+    class CompiledUnion:
+        a: Union[str, int]
+        b: int = 0
+
+    howard.compile(CompiledUnion)
+    result = howard.from_dict({'a': False, 'b': True}, CompiledUnion)
+    assert result.a == 0 and type(result.a) is int
+    assert result.b == 1 and type(result.b) is int
+
+
+def test_from_dict_many():
+    ds = [{'hand_id': i, 'cards': [{'rank': 2, 'suit': 'c'}]} for i in range(3)]
+    hands = howard.from_dict_many(ds, Hand)
+    assert [h.hand_id for h in hands] == [0, 1, 2]
+    assert all(isinstance(h.cards[0], Card) for h in hands)
+    assert howard.to_dict_many(hands) == ds
+
+
+def test_iter_from_dict_is_lazy():
+    def gen():
+        yield {'hand_id': 1}
+        raise AssertionError('consumed too far')
+
+    it = howard.iter_from_dict(gen(), Hand)
+    assert next(it).hand_id == 1
+
+
+def test_many_validates_items():
+    with pytest.raises(TypeError):
+        howard.from_dict_many([{'hand_id': 1}, [1]], Hand)
+    with pytest.raises(TypeError):
+        howard.from_dict_many([{'hand_id': 1}], int)
+    with pytest.raises(TypeError):
+        howard.to_dict_many([Hand(), 1])
+
+
+def test_to_dict_many_mixed_classes():
+    result = list(howard.iter_to_dict([Hand(hand_id=1), Measurement('kg', 1.0)]))
+    assert result == [{'hand_id': 1, 'cards': []}, {'units': 'kg', 'value': 1.0}]
+
+
+def test_load_ndjson():
+    import io
+    data = b'{"units": "kg", "value": 1.5}\n\n{"units": "g", "value": 2.0}\n'
+    result = list(howard.load_ndjson(io.BytesIO(data), Measurement))
+    assert result == [Measurement('kg', 1.5), Measurement('g', 2.0)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 65536])
+def test_iter_json_array(chunk_size):
+    import io
+    import json
+    ds = [{'units': 'kgé€', 'value': 12345.678}, {'units': 'g', 'value': 2.0},
+          {'units': '[,]', 'value': 0.25}]
+    data = json.dumps(ds, ensure_ascii=False, indent=2).encode() + b'\n \n'
+    result = list(howard.iter_json_array(io.BytesIO(data), Measurement, chunk_size=chunk_size))
+    assert result == [Measurement(**d) for d in ds]
+
+
+def test_iter_json_array_mmap(tmp_path):
+    import mmap
+    path = tmp_path / 'data.json'
+    path.write_bytes(b' [ ] ')
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        assert list(howard.iter_json_array(m, Measurement)) == []
+
+    path.write_bytes(b'[{"units": "kg", "value": 1.0}]')
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        assert list(howard.iter_json_array(m, Measurement)) == [Measurement('kg', 1.0)]
+
+
+@pytest.mark.parametrize('data', [b'', b'{}', b'[{"units": "kg", "value": 1.0}', b'[{} {}]', b'[{},]',
+                                  b'[{}] garbage', b'[{}]]'])
+def test_iter_json_array_invalid(data):
+    import io
+    with pytest.raises(ValueError):
+        list(howard.iter_json_array(io.BytesIO(data), Hand, chunk_size=4))
+
+
+def test_iter_json_array_wrong_item_type():
+    import io
+    with pytest.raises(TypeError):
+        list(howard.iter_json_array(io.BytesIO(b'[1]'), Measurement))
+
+
+def test_dumps_matches_json_dumps():
+    import json
+
+    def date_to_seq(d: date) -> Sequence:
+        return (d.year, d.month, d.day)
+
+    @dataclass
+    class Everything:
+        hand: Hand
+        party: Party
+        when: datetime
+        drinks: List[Drink]
+        dob: date = field(metadata=dict(howard=dict(encoder=date_to_seq)))
+        keys: dict = field(default_factory=dict)
+        ratio: float = float('nan')
+        flag: bool = True
+        text: str = 'quote " é \n'
+        _hidden: int = 1
+        internal: int = field(default=2, metadata={'internal': True})
+
+    obj = Everything(
+        hand=Hand(hand_id=1, cards=[Card(2, Suit.club), Card(10, Suit.heart)]),
+        party=Party(party_id=2, players={'John': Hand()}),
+        when=datetime(1994, 11, 5, 13, 15, 30),
+        drinks=[Drink('gin'), Drink('scotch', 'lowball')],
+        dob=date(2020, 1, 15),
+        keys={1: 'a', 2.5: [], None: {}, False: 0},
+    )
+    for public_only in (False, True):
+        expected = json.dumps(howard.to_dict(obj, public_only=public_only))
+        assert howard.dumps(obj, public_only=public_only) == expected
+
+
+def test_dump():
+    import io
+    import json
+    obj = Hand(hand_id=1, cards=[Card(r, Suit.club) for r in range(1, 14)])
+    expected = json.dumps(howard.to_dict(obj))
+
+    text = io.StringIO()
+    howard.dump(obj, text, buffer_size=16)
+    assert text.getvalue() == expected
+
+    binary = io.BytesIO()
+    howard.dump(obj, binary)
+    assert binary.getvalue() == expected.encode()
+
+
+def test_dumps_errors():
+    with pytest.raises(TypeError):
+        howard.dumps({'a': 1})
+    with pytest.raises(TypeError):
+        howard.dumps(UnsupportedTuple(t=(1, 2)))
+
+
+def test_union_of_dataclasses_by_keys():
+    @dataclass
+    class UnionTest:
+        a: Union[Inner, Measurement, str]
+        b: Union[Card, str]
+
+    result = howard.from_dict({'a': {'units': 'kg', 'value': 1.0}, 'b': 'joker'}, UnionTest)
+    assert result.a == Measurement('kg', 1.0)
+    assert result.b == 'joker'
+
+    result = howard.from_dict({'a': {'val': 'x'}, 'b': {'rank': 1, 'suit': 'h'}}, UnionTest)
+    assert result.a == Inner('x')
+    assert result.b == Card(1, Suit.heart)
+
+    with pytest.raises(TypeError):
+        howard.from_dict({'a': {'other': 1}, 'b': 'joker'}, UnionTest)
+
+
+@dataclass
+class Click:
+    kind: Literal['click']
+    x: int
+    y: int
+
+
+@dataclass
+class Scroll:
+    kind: Literal['scroll']
+    x: int
+    delta: int = 0
+
+
+def test_union_with_literal_tags():
+    @dataclass
+    class Events:
+        events: List[Union[Click, Scroll]]
+
+    data = {'events': [{'kind': 'scroll', 'x': 1, 'delta': 2}, {'kind': 'click', 'x': 1, 'y': 2}]}
+    result = howard.from_dict(data, Events)
+    assert result.events == [Scroll('scroll', 1, 2), Click('click', 1, 2)]
+
+    with pytest.raises(TypeError):
+        howard.from_dict({'events': [{'kind': 'drag', 'x': 1}]}, Events)
+    with pytest.raises(TypeError):
+        howard.from_dict({'events': [{'kind': 'click', 'x': '1', 'y': 2}]}, Events)
+
+
+def test_union_with_discriminator():
+    @dataclass
+    class Circle:
+        radius: float
+        shape: str = 'circle'
+
+    @dataclass
+    class Square:
+        radius: float
+        shape: str = 'square'
+
+    @dataclass
+    class Drawing:
+        shapes: List[Union[Circle, Square]] = field(metadata={'howard': {'discriminator': 'shape'}})
+        main: Optional[Union[Circle, Square]] = field(default=None, metadata={'howard': {'discriminator': 'shape'}})
+
+    data = {'shapes': [{'shape': 'square', 'radius': 1.0}, {'shape': 'circle', 'radius': 2.0}],
+            'main': {'shape': 'square', 'radius': 3.0}}
+    result = howard.from_dict(data, Drawing)
+    assert [type(s) for s in result.shapes] == [Square, Circle]
+    assert isinstance(result.main, Square)
+
+    @dataclass
+    class BadDrawing:
+        shape: Union[Circle, Square] = field(metadata={'howard': {'discriminator': 'radius'}})
+
+    with pytest.raises(TypeError):
+        howard.from_dict({'shape': {'radius': 1.0}}, BadDrawing)
+
+
+def test_date_time_timedelta_roundtrip():
+    from datetime import time, timedelta, timezone
+
+    @dataclass
+    class Schedule:
+        day: date
+        start: time
+        length: timedelta
+        created: datetime
+
+    data = {'day': '2020-01-15', 'start': '13:15:30', 'length': 5400.0,
+            'created': '1994-11-05T13:15:30+00:00'}
+    result = howard.from_dict(data, Schedule)
+    assert result == Schedule(date(2020, 1, 15), time(13, 15, 30), timedelta(hours=1.5),
+                              datetime(1994, 11, 5, 13, 15, 30, tzinfo=timezone.utc))
+    assert howard.to_dict(result) == data
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2020-01-01T00:00:00.12Z', '2020-01-01T00:00:00.120000+00:00'),
+    ('2020-01-01T00:00:00+0000', '2020-01-01T00:00:00+00:00'),
+    ('2020-01-01 10:20:30,1234567-0130', '2020-01-01 10:20:30.123456-01:30'),
+    ('2020-01-01T10:20+05', '2020-01-01T10:20+05:00'),
+    ('10:20:30.5z', '10:20:30.500000+00:00'),
+    ('2020-01-01T10:20:30', '2020-01-01T10:20:30'),
+    ('2020-01-01T10:20.5', None),
+    ('2020-01-01', None),
+])
+def test_rfc3339_on_older_pythons(value, expected):
+    # rewritten into what fromisoformat reads before python 3.11
+    assert howard._rewrite_iso(value) == expected
+    if expected is not None:
+        cls = datetime if value[2] != ':' else time
+        assert howard._parse_iso(cls, value) == cls.fromisoformat(expected)
+
+
+def test_datetime_from_epoch():
+    from datetime import timezone
+
+    @dataclass
+    class Event:
+        at: datetime
+
+    assert howard.from_dict({'at': 0}, Event).at == datetime(1970, 1, 1, tzinfo=timezone.utc)
+    assert howard.from_dict({'at': 1.5}, Event).at.microsecond == 500000
+    with pytest.raises(TypeError):
+        howard.from_dict({'at': True}, Event)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('P1W', {'weeks': 1}),
+    ('P2DT3H', {'days': 2, 'hours': 3}),
+    ('PT1.5S', {'seconds': 1.5}),
+    ('-PT10M', {'minutes': -10}),
+])
+def test_timedelta_from_iso_duration(value, expected):
+    from datetime import timedelta
+
+    @dataclass
+    class Timer:
+        length: timedelta
+
+    assert howard.from_dict({'length': value}, Timer).length == timedelta(**expected)
+
+
+@pytest.mark.parametrize('value', ['P', 'PT', '1 day', [1]])
+def test_timedelta_invalid(value):
+    from datetime import timedelta
+
+    @dataclass
+    class Timer:
+        length: timedelta
+
+    with pytest.raises(TypeError):
+        howard.from_dict({'length': value}, Timer)
+
+
+def test_datetime_dateutil_fallback(monkeypatch):
+    pytest.importorskip('dateutil')
+
+    @dataclass
+    class Event:
+        at: datetime
+
+    data = {'at': 'Sat Nov 5 13:15:30 1994'}
+    with pytest.raises(TypeError):
+        howard.from_dict(data, Event)
+
+    monkeypatch.setattr(howard, 'dateutil_fallback', True)
+    assert howard.from_dict(data, Event).at == datetime(1994, 11, 5, 13, 15, 30)
+
+
+def test_union_with_datetime():
+    @dataclass
+    class Event:
+        at: Union[datetime, str]
+
+    assert isinstance(howard.from_dict({'at': '1994-11-05'}, Event).at, datetime)
+    assert howard.from_dict({'at': 'yesterday'}, Event).at == 'yesterday'
+
+
+def test_lazy_from_dict():
+    decoded = []
+
+    def tracked_rank(i):
+        decoded.append(i)
+        return i
+
+    @dataclass
+    class LazyCard:
+        rank: int = field(metadata=dict(howard=dict(decoder=tracked_rank)))
+
+    @dataclass
+    class LazyHand:
+        hand_id: int
+        cards: List[LazyCard]
+        best: Optional[LazyCard] = None
+
+    d = {'hand_id': 1, 'cards': [{'rank': 2}, {'rank': 3}], 'best': {'rank': 4}}
+    obj = howard.from_dict(d, LazyHand, lazy=True)
+    assert isinstance(obj, LazyHand)
+    assert obj.hand_id == 1
+    assert decoded == []
+
+    assert obj.best.rank == 4
+    assert decoded == [4]
+    assert obj.cards == [LazyCard(2), LazyCard(3)]
+    assert obj.cards is obj.cards
+    assert decoded == [4, 2, 3]
+
+    eager = howard.from_dict(d, LazyHand)
+    assert obj == eager and eager == obj
+    assert repr(obj) == repr(eager)
+    assert howard.to_dict(obj) == d
+
+
+def test_lazy_errors_are_deferred():
+    obj = howard.from_dict({'hand_id': 1, 'cards': [{'rank': 'x', 'suit': 'h'}]}, Hand, lazy=True)
+    assert obj.hand_id == 1
+    with pytest.raises(TypeError):
+        obj.cards
+
+    obj = howard.from_dict({'hand_id': 1, 'cards': [{'rank': 1}]}, Hand, lazy=True)
+    with pytest.raises(howard.HowardError) as info:
+        obj.cards
+    assert info.value.path == ('cards', 0, 'suit')
+
+    obj = howard.from_dict({'hand_id': 1, 'cards': [{'rank': 1}]}, Hand, lazy=True)
+    with pytest.raises(howard.HowardError) as info:
+        howard.to_dict(obj)
+    assert info.value.path == ('cards', 0, 'suit')
+
+
+def test_lazy_field_metadata():
+    @dataclass(frozen=True)
+    class LazyOuter:
+        inner: Inner = field(metadata={'howard': {'lazy': True}})
+        other: Inner = field(default=None)
+
+    obj = howard.from_dict({'inner': {'val': 'a'}, 'other': {'val': 'b'}}, LazyOuter)
+    assert obj.__dict__['other'] == Inner('b')
+    assert type(obj.__dict__['inner']) is howard._Pending
+    assert obj.inner == Inner('a')
+    assert type(obj.__dict__['inner']) is Inner
+
+
+def test_lazy_pickle_and_copy():
+    import copy
+    import pickle
+    obj = howard.from_dict({'hand_id': 2, 'cards': [{'rank': 2, 'suit': 'c'}]}, Hand, lazy=True)
+    for clone in (pickle.loads(pickle.dumps(obj)), copy.copy(obj)):
+        assert type(clone) is Hand
+        assert clone == obj
+
+
+def test_string_annotations():
+    from future_models import Address, Person
+
+    result = howard.from_dict({'name': 'Bob', 'age': 24, 'address': {'street': 'Main', 'number': 1}}, Person)
+    assert result == Person('Bob', 24, Address(street='Main', number=1))
+    with pytest.raises(TypeError):
+        howard.from_dict({'name': 'Bob', 'age': '24', 'address': {'street': 'Main', 'number': 1}}, Person)
+    with pytest.raises(TypeError):
+        howard.from_dict({'name': 'Bob', 'age': 24, 'address': {'street': 'Main'}}, Person)
+
+
+def test_self_referencing_dataclass():
+    from future_models import Comment
+
+    d = {'text': 'a', 'replies': [{'text': 'b', 'replies': [{'text': 'c', 'replies': []}]}],
+         'parent': {'text': 'p', 'replies': []}}
+    result = howard.from_dict(d, Comment)
+    assert result.replies[0].replies[0] == Comment('c')
+    assert result.parent == Comment('p')
+    assert howard.from_dict(howard.to_dict(result), Comment) == result
+
+
+def test_deeply_nested_dataclass():
+    from future_models import Comment
+
+    depth = 5000  # well past the recursion limit
+    d = None
+    for i in range(depth):
+        d = {'text': str(i), 'replies': [d] if d else [], 'parent': {'text': 'p'}}
+    result = howard.from_dict(d, Comment)
+    for i in reversed(range(depth)):
+        assert result.text == str(i)
+        assert result.parent == Comment('p')
+        result = result.replies[0] if result.replies else None
+    assert result is None
+
+    d = None
+    for i in range(depth):
+        d = {'text': str(i), 'parent': d}
+    result = howard.to_dict(howard.from_dict(d, Comment))
+    for i in reversed(range(depth)):
+        assert result['text'] == str(i)
+        assert result['replies'] == []
+        result = result['parent']
+    assert result is None
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_deeply_nested_in_container(compiled):
+    @dataclass
+    class Node:
+        value: str
+        children: List['Node'] = field(default_factory=list)
+
+    @dataclass
+    class Tree:
+        roots: List[Node]
+
+    if compiled:
+        howard.compile(Node)
+    d = None
+    for i in range(5000):
+        d = {'value': str(i), 'children': [d] if d else []}
+    # the plan for Node is built and cached first, then used for the list
+    howard.from_dict({'value': 'a'}, Node)
+    assert howard.from_dict({'roots': [d]}, Tree).roots[0].value == '4999'
+    patched = howard.apply_patch(Node('a'), {'children': [d]})
+    assert patched.children[0].children[0].value == '4998'
+
+
+def test_intern_self_referencing():
+    @howard.intern
+    @dataclass(frozen=True)
+    class Node:
+        value: int
+        next: Optional['Node'] = None
+
+    first = howard.from_dict({'value': 1, 'next': {'value': 2}}, Node)
+    assert howard.from_dict({'value': 3, 'next': {'value': 2}}, Node).next is first.next
+
+    d = None
+    for i in range(5000):
+        d = {'value': i, 'next': d}
+    assert howard.from_dict(d, Node).next.value == 4998
+
+
+@pytest.mark.parametrize('all_errors', [False, True])
+def test_deeply_nested_error_path(all_errors):
+    from future_models import Comment
+
+    d = {'text': 1}
+    for i in range(3000):
+        d = {'text': str(i), 'replies': [{'text': 'first'}, d], 'parent': {'text': 'p'}}
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_dict(d, Comment, all_errors=all_errors)
+    assert info.value.path == ('replies', 1) * 3000 + ('text',)
+
+    comment = Comment(object())
+    for i in range(3000):
+        comment = Comment(str(i), parent=comment)
+    with pytest.raises(howard.HowardError) as info:
+        howard.to_dict(comment)
+    assert info.value.path == ('parent',) * 3000 + ('text',)
+
+
+def test_deeply_nested_while_profiling():
+    from future_models import Comment
+
+    d = None
+    for i in range(3000):
+        d = {'text': str(i), 'parent': d}
+    with howard.profile():
+        result = howard.from_dict(d, Comment)
+        encoded = howard.to_dict(result)
+    for i in reversed(range(3000)):
+        assert result.text == encoded['text'] == str(i)
+        result, encoded = result.parent, encoded['parent']
+    assert result is encoded is None
+
+
+def test_walk_matches_plans():
+    from future_models import Comment
+
+    d = {'text': 'a', 'replies': [{'text': 'b', 'replies': [{'text': 'c', 'replies': []}]}, {'text': 'd'}],
+         'parent': {'text': 'p', 'replies': []}}
+    options = howard._Options()
+    result = howard._walk(howard._decode_node(Comment, options, {}), d)
+    assert result == howard.from_dict(d, Comment)
+    encoded = howard._walk(howard._encode_root(Comment, howard._EncodeOptions()), result)
+    assert encoded == howard.to_dict(result)
+
+
+def test_local_forward_reference():
+    @dataclass
+    class Node:
+        value: int
+        children: List['Node'] = field(default_factory=list)
+
+    result = howard.from_dict({'value': 1, 'children': [{'value': 2}]}, Node)
+    assert result.children == [Node(2)]
+
+
+def test_type_hints_are_cached(monkeypatch):
+    import typing
+    Sub = TypedDict('Sub', {'key1': str})
+
+    @dataclass
+    class HintTest:
+        sub: Sub
+
+    howard._type_hints(Sub)
+    howard._type_hints(HintTest)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('resolved hints again')
+    monkeypatch.setattr(typing, 'get_type_hints', fail)
+    assert howard.from_dict({'sub': {'key1': 'a'}}, HintTest).sub == {'key1': 'a'}
+
+
+def test_parallel_from_dict():
+    ds = [{'hand_id': i, 'cards': [{'rank': 1 + i % 13, 'suit': 'c'}]} for i in range(50)]
+    items = [json.dumps(d) if i % 2 else d for i, d in enumerate(ds)]
+    expected = howard.from_dict_many(ds, Hand)
+
+    result = list(howard.parallel_from_dict(iter(items), Hand, workers=2, chunksize=3))
+    assert result == expected
+
+    result = list(howard.parallel_from_dict(items, Hand, workers=2, chunksize=7, ordered=False))
+    assert sorted(result, key=lambda h: h.hand_id) == expected
+
+
+def test_parallel_from_dict_errors():
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(TypeError):
+            list(howard.parallel_from_dict([{'hand_id': 1}, {'hand_id': 'x'}], Hand, executor=executor))
+        with pytest.raises(TypeError):
+            list(howard.parallel_from_dict([1], Hand, executor=executor))
+    with pytest.raises(TypeError):
+        howard.parallel_from_dict([], dict)
+
+
+def test_from_records_columnar():
+    import array
+    from datetime import timezone
+
+    @dataclass
+    class Row:
+        rank: int
+        suit: Suit
+        score: float
+        active: bool
+        name: str
+        seen: datetime
+        note: Optional[str] = None
+        tags: List[str] = field(default_factory=list)
+
+    records = [
+        {'rank': i, 'suit': 'hsdc'[i % 4], 'score': i / 2, 'active': i % 2 == 0,
+         'name': f'n{i}', 'seen': f'2020-01-01T00:00:0{i}Z', 'tags': ['a']}
+        for i in range(5)
+    ]
+    records[0].pop('tags')
+    batch = howard.from_records_columnar(records, Row)
+
+    assert len(batch) == 5
+    assert batch.column('rank') == array.array('q', range(5))
+    assert batch.column('score').typecode == 'd'
+    assert batch.column('active').typecode == 'b'
+    assert batch.column('suit') == array.array('l', [0, 1, 2, 3, 0])
+    assert batch.values('suit')[3] is Suit.club
+    assert batch.values('seen')[1] == datetime(2020, 1, 1, 0, 0, 1, tzinfo=timezone.utc)
+    assert batch.column('note') == [None] * 5
+    assert list(batch) == howard.from_dict_many(records, Row)
+    assert batch[-1] == howard.from_dict(records[-1], Row)
+    with pytest.raises(IndexError):
+        batch[5]
+
+
+@pytest.mark.parametrize('records', [
+    [{'units': 'kg'}],
+    [{'units': 'kg', 'value': '1'}],
+    [1],
+])
+def test_from_records_columnar_invalid(records):
+    with pytest.raises(TypeError):
+        howard.from_records_columnar(records, Measurement)
+
+
+def test_from_records_columnar_error_path():
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_records_columnar([{'units': 'kg', 'value': '1'}], Measurement)
+    assert info.value.path == ('value',)
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_records_columnar([{'value': 1.0}], Measurement)
+    assert info.value.path == ('units',)
+
+
+def test_from_records_columnar_extras():
+    records = [{'units': 'kg', 'value': 1.0, 'extra': 1}]
+    assert len(howard.from_records_columnar(records, Measurement)) == 1
+    with pytest.raises(TypeError):
+        howard.from_records_columnar(records, Measurement, ignore_extras=False)
+
+
+def _construction_variants():
+    from dataclasses import InitVar, KW_ONLY
+
+    @dataclass(slots=True)
+    class Slotted:
+        a: int
+        b: List[int] = field(default_factory=list)
+
+    @dataclass(frozen=True)
+    class Frozen:
+        a: int
+        b: str = 'b'
+        c: List[int] = field(default_factory=list)
+        d: int = field(default=4, init=False)
+
+        def __post_init__(self):
+            object.__setattr__(self, 'd', self.a * 2)
+
+    @dataclass(frozen=True, slots=True)
+    class FrozenSlotted:
+        a: int
+        b: str = 'b'
+
+    @dataclass
+    class PostInit:
+        a: int
+        b: int = field(init=False)
+
+        def __post_init__(self):
+            self.b = self.a + 1
+
+    @dataclass
+    class WithInitVar:
+        a: int
+        scale: InitVar[int] = 1
+
+        def __post_init__(self, scale):
+            self.a *= scale
+
+    @dataclass
+    class KeywordOnly:
+        a: int
+        _: KW_ONLY
+        b: int = 2
+
+    @dataclass
+    class CustomInit:
+        a: int
+
+        def __init__(self, a=0):
+            self.a = a + 1
+
+    return [
+        (Slotted, 'positional'), (Frozen, 'dict'), (FrozenSlotted, 'positional'),
+        (PostInit, 'positional'), (WithInitVar, 'kwargs'), (KeywordOnly, 'kwargs'),
+        (CustomInit, 'kwargs'),
+    ]
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+@pytest.mark.parametrize('t, construction', _construction_variants())
+def test_construction(t, construction, compiled):
+    if compiled:
+        howard.compile(t)
+    assert howard._construction(t) == construction
+
+    assert howard.from_dict({'a': 3}, t) == t(a=3)
+    result = howard.from_dict({'a': 3}, t)
+    assert result == t(3)
+    if hasattr(result, '__dict__'):
+        assert vars(result) == vars(t(3))
+    if construction != 'kwargs':
+        with pytest.raises(TypeError):
+            howard.from_dict({}, t)
+
+
+def test_frozen_defaults_are_fresh():
+    t = dict((c.__name__, c) for c, _ in _construction_variants())['Frozen']
+    first, second = howard.from_dict({'a': 1}, t), howard.from_dict({'a': 1}, t)
+    assert first.c == [] and first.c is not second.c
+    assert first.d == 2
+
+
+@dataclass
+class Arrays:
+    ints: List[int]
+    maybe: List[Optional[float]]
+    anything: Dict[str, Any]
+    scores: Dict[str, int]
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_plain_containers_copy(compiled):
+    if compiled:
+        howard.compile(Arrays)
+    d = {'ints': [1, 2, 3], 'maybe': [1.5, None], 'anything': {'a': [1]}, 'scores': {'a': 1}}
+
+    copied = howard.from_dict(d, Arrays)
+    assert copied == Arrays([1, 2, 3], [1.5, None], {'a': [1]}, {'a': 1})
+    assert all(getattr(copied, k) is not v for k, v in d.items())
+
+    shared = howard.from_dict(d, Arrays, copy=False)
+    assert shared == copied
+    assert all(getattr(shared, k) is v for k, v in d.items())
+
+    result = howard.to_dict(shared)
+    assert result == d
+    assert all(result[k] is not v for k, v in d.items())
+    result = howard.to_dict(shared, copy=False)
+    assert all(result[k] is d[k] for k in ('ints', 'maybe', 'scores'))
+    assert result['anything'] is not d['anything']  # holds a list, which is copied
+
+
+def test_plain_containers_still_convert():
+    converted = howard.from_dict({'ints': [1, True], 'maybe': [], 'anything': {}, 'scores': {}},
+                                 Arrays, copy=False)
+    assert [type(i) for i in converted.ints] == [int, int]
+    with pytest.raises(TypeError):
+        howard.from_dict({'ints': [1, '2'], 'maybe': [], 'anything': {}, 'scores': {}}, Arrays, copy=False)
+    with pytest.raises(TypeError):
+        howard.from_dict({'ints': [], 'maybe': [1], 'anything': {}, 'scores': {}}, Arrays)
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_trusted_input(compiled):
+    @dataclass
+    class Trusted:
+        hand: Hand
+        when: datetime
+        kind: Literal['a', 'b']
+        scores: List[int]
+        note: Optional[str]
+
+    if compiled:
+        howard.compile(Trusted)
+    d = {'hand': {'hand_id': 1, 'cards': [{'rank': 2, 'suit': 'c'}]}, 'when': '2020-01-01T00:00:00',
+         'kind': 'a', 'scores': [1, 2], 'note': 'x'}
+    result = howard.from_dict(d, Trusted, validate=False)
+    assert result == howard.from_dict(d, Trusted)
+    assert result.hand.cards[0].suit is Suit.club
+
+    # the types arent checked, and neither are extra keys
+    d.update(kind='c', scores=['1'], note=3, extra=1)
+    result = howard.from_dict(d, Trusted, ignore_extras=False, validate=False)
+    assert result.kind == 'c'
+    assert result.scores == ['1']
+    assert result.note == 3
+
+    # but custom decoders still run
+    d['hand']['cards'][0]['rank'] = 20
+    with pytest.raises(ValueError):
+        howard.from_dict(d, Trusted, validate=False)
+
+
+def test_trusted_input_many():
+    ds = [{'hand_id': i} for i in range(3)]
+    assert howard.from_dict_many(ds, Hand, validate=False) == howard.from_dict_many(ds, Hand)
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_profile(compiled):
+    @dataclass
+    class Profiled:
+        hand: Hand
+        name: str
+
+    if compiled:
+        howard.compile(Profiled)
+    d = {'hand': {'hand_id': 1, 'cards': [{'rank': 2, 'suit': 'c'}, {'rank': 3, 'suit': 'h'}]}, 'name': 'a'}
+    with howard.profile() as p:
+        for _ in range(2):
+            obj = howard.from_dict(d, Profiled)
+        assert howard.to_dict(obj) == d
+    stats = p.as_dict()
+
+    decoded = stats['decode']
+    assert decoded[f'{__name__}.Hand']['calls'] == 2
+    assert decoded[f'{__name__}.Card']['calls'] == 4
+    assert decoded[f'{__name__}.Card']['fields']['rank']['calls'] == 4
+    profiled = decoded[f'{__name__}.test_profile.<locals>.Profiled']
+    assert set(profiled['fields']) == {'hand', 'name'}
+    assert profiled['time'] >= profiled['fields']['hand']['time'] > 0
+    assert stats['encode'][f'{__name__}.Card']['fields']['suit']['calls'] == 2
+
+    # nothing is recorded once the block exits
+    howard.from_dict(d, Profiled)
+    assert p.as_dict() == stats
+
+
+def test_profile_nested():
+    with howard.profile() as outer:
+        with howard.profile() as inner:
+            howard.from_dict({'hand_id': 1}, Hand)
+        howard.to_dict(Hand())
+    assert list(inner.as_dict()['decode']) == [f'{__name__}.Hand']
+    assert inner.as_dict()['encode'] == {}
+    assert outer.as_dict()['decode'] == {}
+    assert list(outer.as_dict()['encode']) == [f'{__name__}.Hand']
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_error_path(compiled):
+    @dataclass
+    class Member:
+        name: str
+        hands: List[Hand]
+
+    @dataclass
+    class Club:
+        members: Dict[str, Member]
+
+    if compiled:
+        howard.compile(Club)
+    d = {'members': {'bob': {'name': 'Bob', 'hands': [{'hand_id': 1}, {'hand_id': 'x'}]}}}
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_dict(d, Club)
+    error = info.value
+    assert error.path == ('members', 'bob', 'hands', 1, 'hand_id')
+    assert error.location == 'members.bob.hands[1].hand_id'
+    assert error.value == 'x'
+    assert error.expected is int
+    assert str(error) == 'members.bob.hands[1].hand_id: Object "x" not of expected type <class \'int\'>'
+
+    d['members']['bob']['hands'][1] = {'cards': [{'suit': 'c'}]}
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_dict(d, Club)
+    assert info.value.path == ('members', 'bob', 'hands', 1, 'cards', 0, 'rank')
+
+
+def test_compiled_error_path_decodes_once():
+    calls = []
+
+    def count(value):
+        calls.append(value)
+        return value
+
+    @dataclass
+    class Leaf:
+        tag: str = field(metadata={'howard': {'decoder': count}})
+        x: int = 0
+
+    cls, d = Leaf, {'tag': 'leaf', 'x': 'bad'}
+    for depth in range(10):
+        level = dataclasses.make_dataclass(f'Level{depth}', [
+            ('children', List[cls]),
+            ('single', Optional[cls], None),
+            ('tags', list, field(default_factory=lambda: calls.append('factory') or [])),
+        ])
+        cls, d = level, {'children': [{'children': []}, d] if depth else [d]}
+    howard.compile(cls)
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_dict(d, cls)
+    assert info.value.path == ('children', 1) * 9 + ('children', 0, 'x')
+    # everything is decoded once, including the empty first child of each level
+    assert calls.count('leaf') == 1
+    assert calls.count('factory') == 9
+
+@pytest.mark.parametrize('all_errors', [False, True])
+def test_error_message_with_braces(all_errors):
+    Braces = TypedDict('Braces', {'a{b}': int, 'c': int})
+
+    @dataclass
+    class HasBraces:
+        b: Braces
+
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_dict({'b': {'c': 1}}, HasBraces, all_errors=all_errors)
+    assert info.value.path == ('b', 'a{b}')
+    assert info.value.expected is None
+    assert str(info.value) == "b['a{b}']: Object \"{'c': 1}\" is missing required key"
+
+
+def test_error_message_is_lazy():
+    formatted = []
+
+    class Values(list):
+        def __str__(self):
+            formatted.append(self)
+            return super().__str__()
+
+    @dataclass
+    class Single:
+        x: int
+
+    @dataclass
+    class Many:
+        x: List[int]
+
+    @dataclass
+    class Holder:
+        value: Union[Single, Many]
+
+    # Single is tried first and fails, but its error is never shown
+    assert howard.from_dict({'value': {'x': Values([1])}}, Holder) == Holder(Many([1]))
+    assert formatted == []
+
+
+def test_all_errors():
+    d = {'hand_id': 'x', 'cards': [{'rank': 1}, {'rank': 2, 'suit': 'c'}, {'suit': 'c'}]}
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_dict(d, Hand)
+    assert info.value.path == ('hand_id',)
+    assert info.value.errors == []
+
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_dict(d, Hand, all_errors=True)
+    errors = info.value.errors
+    assert [e.path for e in errors] == [('hand_id',), ('cards', 0, 'suit'), ('cards', 2, 'rank')]
+    assert str(info.value).splitlines()[1:] == [f'  {e}' for e in errors]
+
+    # a single error is raised as it is
+    with pytest.raises(howard.HowardError) as info:
+        howard.from_dict({'hand_id': 'x'}, Hand, all_errors=True)
+    assert info.value.path == ('hand_id',)
+    assert howard.from_dict({'hand_id': 1}, Hand, all_errors=True) == Hand(1)
+
+
+def test_encode_error_path():
+    @dataclass
+    class Box:
+        items: List[Any]
+
+    with pytest.raises(howard.HowardError) as info:
+        howard.to_dict(Box([1, object()]))
+    assert info.value.path == ('items', 1)
+
+
+def test_intern():
+    @howard.intern(maxsize=2)
+    @dataclass(frozen=True)
+    class Rank:
+        value: float
+        label: str = field(default='', hash=False, compare=False)
+
+    @dataclass
+    class Ranks:
+        ranks: List[Rank]
+
+    result = howard.from_dict({'ranks': [{'value': 1.0}, {'value': 2.0}, {'value': 1.0}]}, Ranks)
+    assert result.ranks[0] is result.ranks[2]
+    assert result.ranks[0] is not result.ranks[1]
+    assert howard.from_dict({'value': 2.0}, Rank) is result.ranks[1]
+    assert howard.from_dict({'value': 2.0, 'label': 'a'}, Rank).label == 'a'
+
+    # the key includes the types, an int doesnt get the float one
+    with pytest.raises(howard.HowardError):
+        howard.from_dict({'value': 1}, Rank)
+
+    # only the most recently used ones are kept
+    first = howard.from_dict({'value': 1.0}, Rank)
+    howard.from_dict({'value': 3.0}, Rank)
+    howard.from_dict({'value': 4.0}, Rank)
+    assert howard.from_dict({'value': 1.0}, Rank) is not first
+
+
+def test_intern_unhashable_and_errors():
+    @howard.intern
+    @dataclass(frozen=True)
+    class Tagged:
+        tags: Any
+
+    assert howard.from_dict({'tags': {1, 2}}, Tagged).tags == {1, 2}
+
+    # instances holding lists arent shared, changing one would change the others
+    @howard.intern
+    @dataclass(frozen=True)
+    class Listed:
+        tags: List[str]
+
+    first = howard.from_dict({'tags': ['x']}, Listed)
+    second = howard.from_dict({'tags': ['x']}, Listed)
+    first.tags.append('y')
+    assert second.tags == ['x']
+    assert howard.intern(Suit) is Suit
+
+    @dataclass
+    class Mutable:
+        x: int
+
+    with pytest.raises(howard.HowardError):
+        howard.intern(Mutable)
+
+
+def test_apply_patch():
+    hand = Hand(1, [Card(2, Suit.club)])
+    party = Party(1, {'bob': hand})
+
+    patched = howard.apply_patch(party, {'party_id': 2})
+    assert patched == Party(2, {'bob': hand})
+    assert patched.players is party.players
+    assert party.party_id == 1
+
+    patched = howard.apply_patch(hand, {'cards': [{'rank': 3, 'suit': 'h'}], 'extra': 1})
+    assert patched == Hand(1, [Card(3, Suit.heart)])
+
+    with pytest.raises(ValueError):  # custom decoders are used
+        howard.apply_patch(hand, {'cards': [{'rank': 30, 'suit': 'h'}]})
+    with pytest.raises(howard.HowardError) as info:
+        howard.apply_patch(hand, {'cards': [{'rank': 3, 'suit': 'h'}, {'suit': 'h'}]})
+    assert info.value.path == ('cards', 1, 'rank')
+    with pytest.raises(howard.HowardError):
+        howard.apply_patch(hand, {'extra': 1}, ignore_extras=False)
+
+
+def test_apply_patch_in_place():
+    hand = Hand(1, [Card(2, Suit.club)])
+    cards = hand.cards
+    assert howard.apply_patch(hand, {'hand_id': 5}, in_place=True) is hand
+    assert hand == Hand(5, [Card(2, Suit.club)])
+    assert hand.cards is cards
+
+    @dataclass(frozen=True)
+    class Frozen:
+        x: int
+
+    assert howard.apply_patch(Frozen(1), {'x': 2}) == Frozen(2)
+    with pytest.raises(howard.HowardError):
+        howard.apply_patch(Frozen(1), {'x': 2}, in_place=True)
+
+
+def test_to_delta():
+    outer = howard.from_dict({'inner': {'val': 'a'}}, Outer, track_changes=True)
+    assert howard.to_delta(outer) == {}
+    outer.inner.val = 'b'
+    assert howard.to_delta(outer) == {'inner': {'val': 'b'}}
+    outer.inner = Inner('c')
+    assert howard.to_delta(outer) == {'inner': {'val': 'c'}}
+    howard.snapshot(outer)
+    assert howard.to_delta(outer) == {}
+
+    hand = howard.from_dict({'hand_id': 1, 'cards': [{'rank': 2, 'suit': 'c'}]}, Hand, track_changes=True)
+    hand.cards[0].suit = Suit.heart
+    assert howard.to_delta(hand) == {'cards': [{'rank': 2, 'suit': 'h'}]}
+    howard.snapshot(hand)
+    hand.cards.append(Card(3, Suit.club))
+    assert howard.to_delta(hand) == {'cards': [{'rank': 2, 'suit': 'h'}, {'rank': 3, 'suit': 'c'}]}
+
+    party = howard.from_dict({'party_id': 1, 'players': {'bob': {'hand_id': 1}}}, Party, track_changes=True)
+    party.players['bob'].hand_id = 2
+    assert howard.to_delta(party) == {'players': {'bob': {'hand_id': 2, 'cards': []}}}
+
+    # without a snapshot, everything has changed
+    assert howard.to_delta(Hand(1)) == howard.to_dict(Hand(1))
+
+
+def test_to_delta_fields():
+    @dataclass
+    class Account:
+        name: str
+        balance: float = field(metadata={'howard': {'encoder': lambda v: f'{v:.2f}'}})
+        _token: str = ''
+        password: str = field(default='', metadata={'internal': True})
+
+    account = howard.snapshot(Account('a', 1.0, 't', 'p'))
+    account.balance = 2.0
+    account._token = 'u'
+    account.password = 'q'
+    assert howard.to_delta(account) == {'balance': '2.00', '_token': 'u'}
+    assert howard.to_delta(account, public_only=True) == {'balance': '2.00'}
+
+    @dataclass
+    class Position:
+        x: int
+        y: int
+
+    @dataclass
+    class Piece:
+        at: Position = field(metadata={'howard': {'encoder': lambda p: f'{p.x}:{p.y}'}})
+
+    piece = howard.snapshot(Piece(Position(1, 0)))
+    assert howard.to_delta(piece) == {}
+    piece.at.x = 5
+    assert howard.to_delta(piece) == {'at': '5:0'}
+
+
+def test_to_delta_deeply_nested():
+    from future_models import Comment
+
+    d = None
+    for i in range(5000):
+        d = {'text': str(i), 'replies': [d] if d else []}
+    comment = howard.from_dict(d, Comment, track_changes=True)
+    assert howard.to_delta(comment) == {}
+    comment.text = 'edited'
+    assert howard.to_delta(comment) == {'text': 'edited'}
+
+
+def test_to_delta_lazy():
+    hand = howard.from_dict({'hand_id': 1, 'cards': [{'rank': 2, 'suit': 'c'}]}, Hand,
+                            lazy=True, track_changes=True)
+    assert type(hand.__dict__['cards']) is howard._Pending
+    assert howard.to_delta(hand) == {}
+    hand.hand_id = 2
+    assert howard.to_delta(hand) == {'hand_id': 2}
+    # lazy fields arent decoded to take the snapshot or the delta
+    assert type(hand.__dict__['cards']) is howard._Pending
+    hand.cards.append(Card(3, Suit.heart))
+    assert howard.to_delta(hand) == {'hand_id': 2, 'cards': [{'rank': 2, 'suit': 'c'}, {'rank': 3, 'suit': 'h'}]}
+
+
+@dataclass(frozen=True)
+class FrozenPoint:
+    x: int
+
+
+def test_snapshot_kept_outside_instances():
+    obj = howard.from_dict({'x': 1}, FrozenPoint, track_changes=True)
+    assert vars(obj) == {'x': 1}
+    assert howard.to_delta(obj) == {}
+    assert howard.to_delta(pickle.loads(pickle.dumps(obj))) == {'x': 1}
+    assert howard.to_delta(copy.copy(obj)) == {'x': 1}
+    count = len(howard._snapshots)
+    del obj
+    assert len(howard._snapshots) == count - 1
+
+
+def _decode_stream(chunks, t, **kwargs):
+    async def main():
+        reader = asyncio.StreamReader()
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        return [item async for item in howard.aiter_decode(reader, t, **kwargs)]
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('data', [
+    b'{"hand_id": 1}\n\n{"hand_id": 2, "cards": [{"rank": 3, "suit": "h"}]}\n{"hand_id": 3}',
+    b'  [{"hand_id": 1}, {"hand_id": 2, "cards": [{"rank": 3, "suit": "h"}]} ,{"hand_id": 3}] ',
+])
+@pytest.mark.parametrize('executor', [False, True])
+def test_aiter_decode(data, executor):
+    expected = [Hand(1), Hand(2, [Card(3, Suit.heart)]), Hand(3)]
+    chunks = [data[i:i + 5] for i in range(0, len(data), 5)]
+    kwargs = {'chunk_size': 7}
+    with futures.ThreadPoolExecutor(1) as pool:
+        if executor:
+            kwargs['executor'] = pool
+        assert _decode_stream(chunks, Hand, **kwargs) == expected
+        assert _decode_stream([data], Hand, **kwargs) == expected
+    assert _decode_stream([b''], Hand) == []
+
+
+def test_aiter_decode_yields_early():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'[{"hand_id": 1}, {"hand_')
+        records = howard.aiter_decode(reader, Hand)
+        # the first record arrives before the rest of the stream
+        first = await records.__anext__()
+        reader.feed_data(b'id": 2}]')
+        reader.feed_eof()
+        return [first] + [item async for item in records]
+    assert asyncio.run(main()) == [Hand(1), Hand(2)]
+
+
+def test_aiter_decode_invalid():
+    with pytest.raises(howard.HowardError):
+        _decode_stream([b'{"hand_id": "x"}\n'], Hand)
+    with pytest.raises(howard.HowardError):
+        _decode_stream([b'[1]'], Hand)
+    with pytest.raises(json.JSONDecodeError):
+        _decode_stream([b'[{"hand_id": 1}, {"hand'], Hand)
+
+
+def test_register():
+    @dataclass
+    class Registered:
+        hand: Hand
+        when: datetime
+
+    howard.register(Registered)
+    assert (Registered, howard._Options(), None) in howard._decoders
+    assert (Hand, howard._EncodeOptions()) in howard._encoders
+    assert (Card, howard._EncodeOptions(copy=False)) in howard._encoders
+
+    from future_models import Player, Team
+
+    assert howard._type_hints(Team)['lead'] is Player
+    assert Player in howard._compiled
+    assert howard.from_dict({'lead': {'name': 'a'}}, Team) == Team(Player('a'))
+
+
+def test_register_keeps_other_plans():
+    @howard.model
+    @dataclass
+    class Before:
+        hand: Hand
+
+    @howard.model(compiled=True)
+    @dataclass
+    class Compiled:
+        name: str
+
+    # only plans that reach the newly compiled, interned or registered types are rebuilt
+    assert (Before, howard._Options(), None) in howard._decoders
+    assert (Before, howard._EncodeOptions()) in howard._encoders
+
+    @howard.intern
+    @dataclass(frozen=True)
+    class Interned:
+        name: str
+
+    assert (Before, howard._Options(), None) in howard._decoders
+    assert (Compiled, howard._Options(), None) in howard._decoders
+
+    class Code(str):
+        pass
+
+    @dataclass
+    class Coded:
+        code: Optional[Code]
+
+    howard.register(Coded)
+    howard.register_type(Code, decode=lambda s: Code(s.upper()))
+    try:
+        assert (Before, howard._Options(), None) in howard._decoders
+        assert (Coded, howard._Options(), None) not in howard._decoders
+        assert howard.from_dict({'code': 'ab'}, Coded) == Coded(Code('AB'))
+    finally:
+        del howard._type_decoders[Code]
+
+
+def test_register_unresolved():
+    @dataclass
+    class Unresolved:
+        x: 'Missing'  # noqa: F821
+
+    howard.register(Unresolved)
+    try:
+        with pytest.raises(howard.HowardError):
+            howard.register()
+    finally:
+        howard._registered.clear()
+    assert Unresolved not in howard._hints
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_decoder_built_concurrently(compiled):
+    fields = [(f'a{i}', Optional[int], None) for i in range(30)]
+    data = {f'a{i}': i for i in range(30)}
+    interval = sys.getswitchinterval()
+    # switch threads as often as possible, so they run into plans still being built
+    sys.setswitchinterval(1e-6)
+    try:
+        for trial in range(50):
+            cls = dataclasses.make_dataclass(f'Wide{trial}', fields)
+            if compiled:
+                howard._compiled.add(cls)
+            barrier = threading.Barrier(4)
+
+            def decode(_):
+                barrier.wait()
+                return howard.from_dict(data, cls)
+
+            with futures.ThreadPoolExecutor(4) as executor:
+                results = list(executor.map(decode, range(4)))
+            assert results == [cls(*range(30))] * 4
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_compile_forward_reference(monkeypatch):
+    @howard.compile
+    @dataclass
+    class Earlier:
+        later: 'Later'  # noqa: F821
+
+    # the decoder cant be built yet, and nothing broken is kept around
+    with pytest.raises(howard.HowardError):
+        howard.from_dict({'later': {'x': 1}}, Earlier)
+
+    @dataclass
+    class Later:
+        x: int
+
+    monkeypatch.setitem(globals(), 'Later', Later)
+    assert howard.from_dict({'later': {'x': 1}}, Earlier) == Earlier(Later(1))
+    assert Later in howard._compiled
+
+
+def test_compile_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(howard, 'cache_dir', str(tmp_path))
+
+    @dataclass
+    class Cached:
+        x: int
+        cards: List[Card]
+
+    howard.compile(Cached)
+    files = sorted(tmp_path.iterdir())
+    assert files
+
+    # a new process would find the bytecode and not compile again
+    with monkeypatch.context() as m:
+        compiled = []
+        m.setattr(howard.builtins, 'compile', lambda *args: compiled.append(args))
+        howard.compile(Cached)
+        assert compiled == []
+    assert howard.from_dict({'x': 1, 'cards': []}, Cached) == Cached(1, [])
+
+    # broken files are compiled again
+    for path in files:
+        path.write_bytes(b'broken')
+    howard.compile(Cached)
+    assert howard.from_dict({'x': 1, 'cards': []}, Cached) == Cached(1, [])
+    assert sorted(tmp_path.iterdir()) == files
+
+
+class Money:
+    def __init__(self, cents):
+        # like Decimal, can be built from an instance of a parent class
+        self.cents = getattr(cents, 'cents', cents)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.cents == other.cents
+
+    @classmethod
+    def parse(cls, s):
+        return cls(round(float(s) * 100))
+
+
+class Euros(Money):
+    pass
+
+
+howard.register_type(Money, decode=Money.parse, encode=lambda m: f'{m.cents / 100:.2f}')
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_register_type(compiled):
+    @dataclass
+    class Invoice:
+        total: Money
+        paid: Optional[Euros]
+        lines: List[Money]
+
+    if compiled:
+        howard.compile(Invoice)
+    invoice = howard.from_dict({'total': '3.50', 'paid': '1.25', 'lines': ['1.00', '2.50']}, Invoice)
+    assert invoice == Invoice(Money(350), Euros(125), [Money(100), Money(250)])
+    assert type(invoice.paid) is Euros
+
+    expected = {'total': '3.50', 'paid': '1.25', 'lines': ['1.00', '2.50']}
+    assert howard.to_dict(invoice) == expected
+    assert json.loads(howard.dumps(invoice)) == expected
+
+
+def test_register_type_in_unions(monkeypatch):
+    class Cents(int):
+        pass
+
+    @dataclass
+    class Order:
+        price: Optional[Cents]
+        amount: Union[int, Cents]
+        placed: Optional[datetime]
+
+    # the datetime decoder is only registered for this test
+    monkeypatch.setattr(howard, '_type_decoders', {})
+    try:
+        howard.register_type(Cents, decode=lambda s: Cents(round(float(s) * 100)))
+        howard.register_type(datetime, decode=lambda d: datetime(d['year'], d['month'], d['day']))
+        d = {'price': '1.50', 'amount': '2', 'placed': {'year': 2020, 'month': 1, 'day': 2}}
+        assert howard.from_dict(d, Order) == Order(Cents(150), Cents(200), datetime(2020, 1, 2))
+        d = {'price': None, 'amount': 3, 'placed': None}
+        assert howard.from_dict(d, Order) == Order(None, 3, None)
+    finally:
+        monkeypatch.undo()
+        howard._decoders.clear()
+
+
+def test_register_type_errors():
+    with pytest.raises(howard.HowardError):
+        howard.register_type(str, decode=str.upper)
+    with pytest.raises(howard.HowardError):
+        howard.register_type(Hand, encode=repr)
+    with pytest.raises(howard.HowardError):
+        howard.register_type(Money)